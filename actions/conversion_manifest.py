@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+import settings
+from actions.conversion_report import REPORT_JSON_FILE_NAME, REPORT_CSV_FILE_NAME
+from library.parse_cache import get_parser_fingerprint
+from library.utils.file_utils import hash_file
+
+# Manifest of incremental conversion (see convert_all). Stored in the output directory, describes every successfully
+# converted input file: its size, modification time and hash, files it required during conversion and produced output
+# files. Input is converted again only if any of those changed, or converter itself changed
+
+MANIFEST_FILE_NAME = '.nfsrc_manifest.json'
+MANIFEST_VERSION = 1
+# files in the output directory, which are not produced by serializers
+_SERVICE_FILE_NAMES = {MANIFEST_FILE_NAME, 'skipped.txt', REPORT_JSON_FILE_NAME, REPORT_CSV_FILE_NAME}
+
+# settings, which do not affect produced files
+_RUNTIME_SETTINGS = {'multiprocess_processes_count', 'print_errors', 'print_blender_log', 'files_cache_max_size',
+                     'mmap_input_files', 'lazy_archive_children', 'parse_cache_directory', 'save_conversion_report',
+                     'deduplicate_inputs'}
+
+_converter_fingerprint = None
+
+
+# parser and serializers code + settings
+def get_converter_fingerprint() -> str:
+    global _converter_fingerprint
+    if _converter_fingerprint is None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha1(get_parser_fingerprint().encode('utf8'))
+        for subdir, dirs, files in os.walk(os.path.join(project_root, 'serializers')):
+            dirs.sort()
+            for file_name in sorted(f for f in files if f.endswith('.py')):
+                file_path = os.path.join(subdir, file_name)
+                digest.update(os.path.relpath(file_path, project_root).replace('\\', '/').encode('utf8'))
+                with open(file_path, 'rb') as f:
+                    digest.update(f.read())
+        settings_values = {key: value for (key, value) in vars(settings).items()
+                           if not key.startswith('_') and key not in _RUNTIME_SETTINGS
+                           and isinstance(value, (str, int, float, bool, dict, list, tuple, type(None)))}
+        digest.update(json.dumps(settings_values, sort_keys=True, default=str).encode('utf8'))
+        _converter_fingerprint = digest.hexdigest()[:16]
+    return _converter_fingerprint
+
+
+def get_file_stamp(path: str) -> Optional[list]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# fingerprint of input file: size, modification time and hash. None if file does not exist anymore
+def get_input_fingerprint(path: str) -> Optional[Dict]:
+    stamp = get_file_stamp(path)
+    if stamp is None:
+        return None
+    try:
+        return {'size': stamp[0], 'mtime_ns': stamp[1], 'sha1': hash_file(path)}
+    except OSError:
+        return None
+
+
+# checks if manifest entry describes current state of the input file and files, it depends on. File with updated
+# modification time, but the same content, is considered unchanged, entry is updated in this case
+def is_entry_up_to_date(entry: Dict, path: str) -> bool:
+    stamp = get_file_stamp(path)
+    if stamp is None or stamp[0] != entry['size']:
+        return False
+    if stamp[1] != entry['mtime_ns']:
+        if hash_file(path) != entry['sha1']:
+            return False
+        entry['mtime_ns'] = stamp[1]
+    return all(get_file_stamp(dependency) == dependency_stamp
+               for (dependency, dependency_stamp) in entry['dependencies'].items())
+
+
+def load_manifest(out_path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(out_path, MANIFEST_FILE_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(out_path: str, manifest: Dict):
+    os.makedirs(out_path, exist_ok=True)
+    manifest_path = os.path.join(out_path, MANIFEST_FILE_NAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+# finds files, produced by serializers. Serializer of input "A.FSH" writes to "A.FSH" (directory), "A.FSH.png",
+# "A.FSH.meta.json", "A.FSH_loop.mp3" etc. in the corresponding output directory. Entry of output directory belongs to
+# input with the longest matching name, so outputs of "A.FSH_OLD" are not taken as outputs of "A.FSH".
+# output_bases: list of (input key, output base path), excluded_paths: output directories, which mirror input
+# directories. Returns input key -> list of output paths, relative to out_path
+def find_outputs(out_path: str, output_bases, excluded_paths=()) -> Dict[str, list]:
+    excluded_paths = {os.path.normpath(x) for x in excluded_paths}
+    by_directory = {}
+    for (key, base) in output_bases:
+        (directory, base_name) = os.path.split(os.path.normpath(base))
+        by_directory.setdefault(directory, []).append((base_name, key))
+    res = {key: [] for (key, _) in output_bases}
+    for directory, bases in by_directory.items():
+        try:
+            entries = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        bases.sort(key=lambda x: len(x[0]), reverse=True)
+        for entry in entries:
+            if (entry in _SERVICE_FILE_NAMES
+                    or os.path.normpath(os.path.join(directory, entry)) in excluded_paths):
+                continue
+            for (base_name, key) in bases:
+                if entry == base_name or entry.startswith(base_name + '.') or entry.startswith(base_name + '_'):
+                    res[key].append(os.path.relpath(os.path.join(directory, entry), out_path).replace('\\', '/'))
+                    break
+    return res
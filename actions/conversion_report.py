@@ -0,0 +1,65 @@
+import csv
+import json
+import os
+from typing import Dict, List
+
+# Report of convert_all (see settings.save_conversion_report): timings, memory usage and output size of every converted
+# file and aggregates by resource class. Saved to the output directory as JSON and CSV (files only)
+
+REPORT_JSON_FILE_NAME = 'conversion_report.json'
+REPORT_CSV_FILE_NAME = 'conversion_report.csv'
+
+# status is "converted", "failed" or "duplicate" (outputs are copied from the file with the same name and content)
+# peak_rss is the peak memory usage of worker process by the end of file conversion. Worker converts many files, so
+# only growth of it is caused by the file for sure
+REPORT_COLUMNS = ['input', 'resource_class', 'status', 'total_time', 'parse_time', 'serialize_time',
+                  'external_tools_time', 'peak_rss', 'input_bytes', 'output_bytes', 'error']
+_TIME_COLUMNS = ['total_time', 'parse_time', 'serialize_time', 'external_tools_time']
+_SIZE_COLUMNS = ['input_bytes', 'output_bytes']
+
+
+def get_outputs_size(out_path: str, outputs: List[str]) -> int:
+    size = 0
+    for output in outputs:
+        path = os.path.join(out_path, output)
+        if os.path.isdir(path):
+            for subdir, dirs, files in os.walk(path):
+                size += sum(os.path.getsize(os.path.join(subdir, f)) for f in files)
+        elif os.path.isfile(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def aggregate_by_resource_class(rows: List[Dict]) -> Dict[str, Dict]:
+    res = {}
+    for row in rows:
+        aggregate = res.setdefault(row['resource_class'], {'files': 0,
+                                                           'failed': 0,
+                                                           **{x: 0 for x in _TIME_COLUMNS + _SIZE_COLUMNS},
+                                                           'max_peak_rss': None})
+        aggregate['files'] += 1
+        if row['status'] == 'failed':
+            aggregate['failed'] += 1
+        for column in _TIME_COLUMNS + _SIZE_COLUMNS:
+            aggregate[column] += row[column] or 0
+        if row['peak_rss'] is not None:
+            aggregate['max_peak_rss'] = max(aggregate['max_peak_rss'] or 0, row['peak_rss'])
+    for aggregate in res.values():
+        for column in _TIME_COLUMNS:
+            aggregate[column] = round(aggregate[column], 3)
+    return dict(sorted(res.items(), key=lambda x: x[1]['total_time'], reverse=True))
+
+
+def save_conversion_report(out_path: str, rows: List[Dict], summary: Dict):
+    rows = sorted(rows, key=lambda x: x['total_time'], reverse=True)
+    os.makedirs(out_path, exist_ok=True)
+    with open(os.path.join(out_path, REPORT_JSON_FILE_NAME), 'w') as f:
+        json.dump({
+            **summary,
+            'resource_classes': aggregate_by_resource_class(rows),
+            'files': rows,
+        }, f, indent=1)
+    with open(os.path.join(out_path, REPORT_CSV_FILE_NAME), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -1,3 +1,4 @@
+import math
 import os
 import time
 import traceback
@@ -8,13 +9,53 @@ from tqdm import tqdm
 
 import settings
 from library import require_file
+from library.loader import track_required_files
 from library.utils import format_exception
+from library.utils.file_utils import remove_file_or_directory, hash_file, copy_file_or_directory
+from library.utils.profiling import get_external_tools_time, get_peak_rss
 from serializers import get_serializer
 
 
+# relative cost of converting one byte of file by extension. Maps and models are exported via blender and take much
+# more time than images or audio of the same size
+CONVERSION_COST_WEIGHTS = {
+    '.TRI': 20,
+    '.FAM': 20,
+    '.CFM': 10,
+    '.GEO': 10,
+    '.VIV': 5,
+    '.QFS': 3,
+}
+# fixed cost of any file (in bytes), spent on opening it, probing the block class and sending the task to the process
+CONVERSION_FILE_OVERHEAD = 64 * 1024
+
+
+# returns tuple (exception or None, list of files, which were required for conversion, stats). Stats is a dict with
+# resource class, times (in seconds) of parsing, serializing, running external tools and total, peak memory usage
 def export_file(base_input_path, path, out_path):
+    start_time = time.perf_counter()
+    external_tools_start_time = get_external_tools_time()
+    stats = {'resource_class': None, 'parse_time': 0, 'serialize_time': 0}
+    with track_required_files() as required_files:
+        ex = _export_file(base_input_path, path, out_path, stats)
+    stats['external_tools_time'] = get_external_tools_time() - external_tools_start_time
+    stats['total_time'] = time.perf_counter() - start_time
+    stats['peak_rss'] = get_peak_rss()
+    return ex, sorted(required_files), stats
+
+
+# exports multiple small files in one task
+def export_files(base_input_path, paths, out_path):
+    return [export_file(base_input_path, path, out_path) for path in paths]
+
+
+def _export_file(base_input_path, path, out_path, stats):
     try:
+        start_time = time.perf_counter()
         (name, block, data) = require_file(path)
+        stats['parse_time'] = time.perf_counter() - start_time
+        stats['resource_class'] = block.__class__.__name__
+        start_time = time.perf_counter()
         serializer = get_serializer(block, data)
         rel_path = path[len(base_input_path):]
         if not rel_path:
@@ -25,31 +66,320 @@ def export_file(base_input_path, path, out_path):
             if is_dir:
                 rel_path = path.split('/')[-1]
         serializer.serialize(data, f'{out_path}/{rel_path}', id=name, block=block)
+        stats['serialize_time'] = time.perf_counter() - start_time
     except Exception as ex:
         if settings.print_errors:
             traceback.print_exc()
         return ex
 
 
-def convert_all(path, out_path):
+def _get_input_key(base_input_path, path):
+    rel_path = path[len(base_input_path):].replace('\\', '/').strip('/')
+    return rel_path or os.path.basename(path)
+
+
+# path, which serializer gets for the input file. Serializer appends suffixes to it or creates directory
+def _get_output_base(base_input_path, path, out_path):
+    rel_path = path[len(base_input_path):]
+    if not rel_path:
+        rel_path = os.path.basename(path)
+    return os.path.normpath(f'{out_path}/{rel_path}')
+
+
+def _remove_outputs(out_path, outputs):
+    for output in outputs:
+        remove_file_or_directory(os.path.join(out_path, output))
+
+
+# finds inputs, which have to be converted again, removes outdated outputs. Returns tuple (files to convert,
+# manifest entries of unchanged files, manifest entries of files to convert from the previous run)
+def _prepare_incremental_conversion(base_input_path, out_path, files_to_open):
+    from actions.conversion_manifest import load_manifest, get_converter_fingerprint, is_entry_up_to_date
+    manifest = load_manifest(out_path)
+    if manifest is None or manifest['input'] != os.path.abspath(base_input_path):
+        return files_to_open, {}, {}
+    is_same_converter = manifest['converter'] == get_converter_fingerprint()
+    input_keys = {_get_input_key(base_input_path, f) for f in files_to_open}
+    for key, entry in manifest['files'].items():
+        if key not in input_keys:
+            # input was removed
+            _remove_outputs(out_path, entry['outputs'])
+    files_to_convert = []
+    unchanged_entries = {}
+    previous_entries = {}
+    for f in files_to_open:
+        key = _get_input_key(base_input_path, f)
+        entry = manifest['files'].get(key)
+        if entry is not None and is_same_converter and is_entry_up_to_date(entry, f):
+            unchanged_entries[key] = entry
+            continue
+        if entry is not None:
+            _remove_outputs(out_path, entry['outputs'])
+            previous_entries[f] = entry
+        files_to_convert.append(f)
+    for skipped_report in manifest.get('skipped_reports', []):
+        remove_file_or_directory(os.path.join(out_path, skipped_report))
+    return files_to_convert, unchanged_entries, previous_entries
+
+
+# returns input key -> list of output paths
+def _find_outputs(base_input_path, out_path, files_to_open, input_dirs):
+    from actions.conversion_manifest import find_outputs
+    # all inputs are passed to find outputs correctly: "A.FSH_OLD.png" belongs to "A.FSH_OLD", not "A.FSH"
+    return find_outputs(out_path,
+                        [(_get_input_key(base_input_path, f), _get_output_base(base_input_path, f, out_path))
+                         for f in files_to_open],
+                        excluded_paths=[_get_output_base(base_input_path, d, out_path) for d in input_dirs
+                                        if d != base_input_path])
+
+
+def _save_incremental_manifest(base_input_path, out_path, outputs, converted, unchanged_entries, skipped_reports):
+    from actions.conversion_manifest import (save_manifest, get_converter_fingerprint, get_input_fingerprint,
+                                             get_file_stamp, MANIFEST_VERSION)
+    entries = dict(unchanged_entries)
+    for (path, dependencies, stats) in converted:
+        fingerprint = get_input_fingerprint(path)
+        if fingerprint is None:
+            # input was removed or renamed during conversion
+            continue
+        key = _get_input_key(base_input_path, path)
+        dependencies = {os.path.abspath(d) for d in dependencies} - {os.path.abspath(path)}
+        entries[key] = {
+            **fingerprint,
+            'dependencies': {d: get_file_stamp(d) for d in sorted(dependencies) if get_file_stamp(d) is not None},
+            'outputs': outputs[key],
+            'duration': round(stats['total_time'], 3),
+        }
+    save_manifest(out_path, {
+        'version': MANIFEST_VERSION,
+        'converter': get_converter_fingerprint(),
+        'input': os.path.abspath(base_input_path),
+        'files': entries,
+        'skipped_reports': skipped_reports,
+    })
+
+
+def _estimate_conversion_cost(path):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    extension = os.path.splitext(path)[1].upper()
+    return CONVERSION_FILE_OVERHEAD + size * CONVERSION_COST_WEIGHTS.get(extension, 1)
+
+
+# returns file -> path of another file, which is required for its conversion and is shared with other files (files
+# cache is not shared between processes, so such files are converted in the same task). Dependencies are known
+# from the resources (palette files) and from the manifest of previous run
+def _find_shared_dependencies(files, previous_entries):
+    from resources.eac.utils import get_external_palette_file
+    dependencies = {}
+    for f in files:
+        path = os.path.abspath(f)
+        candidates = [x for x in previous_entries.get(f, {}).get('dependencies', {}) if x != path]
+        palette_file = get_external_palette_file(path)
+        if palette_file is not None:
+            candidates.insert(0, os.path.normpath(palette_file))
+        if candidates:
+            dependencies[f] = candidates[0]
+    # dependency itself is converted in the same task as well
+    users = defaultdict(lambda: 0, {os.path.abspath(f): 1 for f in files})
+    for dependency in dependencies.values():
+        users[dependency] += 1
+    return {f: dependency for (f, dependency) in dependencies.items() if users[dependency] > 1}
+
+
+# splits files to tasks for the pool, ordered by estimated cost, largest first: so the biggest files do not start at
+# the end of conversion, leaving other processes idle. Small files are grouped, to not send thousands of tasks.
+# Files with the same shared dependency (and the dependency itself) are kept in one task, so it is parsed once, unless
+# they cost more than a single process share. Known conversion times from previous run are used instead of
+# estimations, when available. Returns list of lists of file indices
+def _schedule_conversion(files, processes, previous_entries):
+    previous_durations = {f: entry['duration'] for (f, entry) in previous_entries.items()
+                          if entry.get('duration') is not None}
+    costs = [_estimate_conversion_cost(f) for f in files]
+    learned = [(costs[i], previous_durations[f]) for i, f in enumerate(files) if f in previous_durations]
+    learned_cost = sum(cost for (cost, _) in learned)
+    if learned_cost > 0:
+        # estimations are scaled to seconds, spent by similar files
+        seconds_per_cost = sum(duration for (_, duration) in learned) / learned_cost
+        costs = [previous_durations.get(f, cost * seconds_per_cost) for (f, cost) in zip(files, costs)]
+    dependencies = _find_shared_dependencies(files, previous_entries)
+    indices = {os.path.abspath(f): i for i, f in enumerate(files)}
+    groups = defaultdict(lambda: list())
+    for i, f in enumerate(files):
+        dependency = dependencies.get(f)
+        if dependency is None and os.path.abspath(f) in dependencies.values():
+            dependency = os.path.abspath(f)
+        if dependency is not None:
+            groups[dependency].append(i)
+    # dependency goes first in the group
+    for dependency, group in groups.items():
+        group.sort(key=lambda i: i != indices.get(dependency))
+    grouped = {i for group in groups.values() for i in group}
+    units = [[i] for i in range(len(files)) if i not in grouped]
+    max_group_cost = sum(costs) / processes
+    for group in groups.values():
+        parts = max(1, math.ceil(sum(costs[i] for i in group) / max_group_cost)) if max_group_cost > 0 else 1
+        units += [group[j::parts] for j in range(parts)]
+    unit_costs = [sum(costs[i] for i in unit) for unit in units]
+    order = sorted(range(len(units)), key=lambda i: unit_costs[i], reverse=True)
+    chunk_cost = sum(costs) / (processes * 16)
+    tasks = []
+    chunk = []
+    current_cost = 0
+    for i in order:
+        if unit_costs[i] >= chunk_cost or len(units[i]) > 1:
+            tasks.append(units[i])
+            continue
+        chunk += units[i]
+        current_cost += unit_costs[i]
+        if current_cost >= chunk_cost or len(chunk) >= 64:
+            tasks.append(chunk)
+            chunk = []
+            current_cost = 0
+    if chunk:
+        tasks.append(chunk)
+    return tasks
+
+
+# returns tuple (files to convert, first file -> list of other files with the same name and content). Serializers
+# name outputs after the input file, so only files with the same name produce the same outputs
+def _find_duplicates(files):
+    by_name_and_size = defaultdict(lambda: list())
+    for f in files:
+        try:
+            by_name_and_size[(os.path.basename(f), os.path.getsize(f))].append(f)
+        except Exception:
+            # file is converted as usual and gets to skipped.txt, if it is broken
+            if settings.print_errors:
+                traceback.print_exc()
+    duplicates = {}
+    for candidates in by_name_and_size.values():
+        if len(candidates) < 2:
+            continue
+        by_hash = defaultdict(lambda: list())
+        for f in candidates:
+            try:
+                by_hash[hash_file(f)].append(f)
+            except Exception:
+                if settings.print_errors:
+                    traceback.print_exc()
+        for same_files in by_hash.values():
+            if len(same_files) > 1:
+                duplicates[same_files[0]] = same_files[1:]
+    copies = {f for same_files in duplicates.values() for f in same_files}
+    return [f for f in files if f not in copies], duplicates
+
+
+# copies outputs of the converted file to the output directory of its duplicate. If conversion failed, nothing is
+# copied and duplicate gets the same error. Returns the same tuple as export_file
+def _copy_outputs(base_input_path, out_path, outputs, original, original_result, duplicate):
+    start_time = time.perf_counter()
+    (ex, _, original_stats) = original_result
+    if not isinstance(ex, Exception):
+        (original_base, duplicate_base) = (
+            os.path.relpath(_get_output_base(base_input_path, x, out_path), out_path).replace('\\', '/')
+            for x in [original, duplicate])
+        for output in outputs:
+            copy_file_or_directory(os.path.join(out_path, output),
+                                   os.path.join(out_path, duplicate_base + output[len(original_base):]),
+                                   hardlink=settings.deduplicate_inputs == 'hardlink')
+    return ex, [duplicate], {'resource_class': original_stats['resource_class'],
+                             'parse_time': 0,
+                             'serialize_time': 0,
+                             'external_tools_time': 0,
+                             'total_time': time.perf_counter() - start_time,
+                             'peak_rss': None,
+                             'duplicate_of': _get_input_key(base_input_path, original)}
+
+
+# converts files in the pool, returns file -> export_file result
+def _run_conversion(pool, pbar, base_input_path, files, out_path, processes, previous_entries):
+    tasks = _schedule_conversion(files, processes, previous_entries)
+    async_results = [pool.apply_async(export_files,
+                                      (base_input_path, [files[i] for i in task], out_path),
+                                      callback=lambda res: pbar.update(len(res)))
+                     for task in tasks]
+    results = {}
+    for task, async_result in zip(tasks, async_results):
+        for i, result in zip(task, async_result.get()):
+            results[files[i]] = result
+    return results
+
+
+def _save_conversion_report(base_input_path, out_path, outputs, files_to_convert, results, summary):
+    from actions.conversion_report import save_conversion_report, get_outputs_size
+    rows = []
+    for path, (exc, _, stats) in zip(files_to_convert, results):
+        key = _get_input_key(base_input_path, path)
+        rows.append({
+            'input': key,
+            'resource_class': stats['resource_class'] or 'unknown',
+            'status': ('failed' if isinstance(exc, Exception)
+                       else 'duplicate' if stats.get('duplicate_of') else 'converted'),
+            **{x: round(stats[x], 3) for x in ['total_time', 'parse_time', 'serialize_time', 'external_tools_time']},
+            'peak_rss': stats['peak_rss'],
+            'input_bytes': os.path.getsize(path) if os.path.isfile(path) else None,
+            'output_bytes': get_outputs_size(out_path, outputs[key]),
+            'error': format_exception(exc) if isinstance(exc, Exception) else None,
+        })
+    save_conversion_report(out_path, rows, summary)
+
+
+# in incremental mode, writes manifest of converted files to the output directory. Next runs convert only changed
+# files and remove outputs of deleted ones (see actions/conversion_manifest.py)
+def convert_all(path, out_path, incremental=False):
     start_time = time.time()
     base_input_path = str(path)
+    out_path = str(out_path)
     files_to_open = []
+    input_dirs = []
     if os.path.isdir(path):
         for subdir, dirs, files in os.walk(path):
+            input_dirs.append(subdir)
             files_to_open += [os.path.join(subdir, f) for f in files]
     else:
         files_to_open = [str(path)]
 
+    files_to_convert = files_to_open
+    unchanged_entries = {}
+    previous_entries = {}
+    if incremental:
+        (files_to_convert, unchanged_entries, previous_entries) = _prepare_incremental_conversion(base_input_path,
+                                                                                                  out_path,
+                                                                                                  files_to_open)
+        if unchanged_entries:
+            print(f'Skipping {len(unchanged_entries)} unchanged files')
+
     processes = cpu_count() if settings.multiprocess_processes_count == 0 else settings.multiprocess_processes_count
+    (unique_files, duplicates) = (_find_duplicates(files_to_convert) if settings.deduplicate_inputs
+                                  else (files_to_convert, {}))
     with Pool(processes=processes) as pool:
-        pbar = tqdm(total=len(files_to_open))
-        results = [pool.apply_async(export_file, (base_input_path, f, out_path), callback=lambda *a: pbar.update()) for
-                   f in files_to_open]
-        results = list(result.get() for result in results)
+        pbar = tqdm(total=len(files_to_convert))
+        results = _run_conversion(pool, pbar, base_input_path, unique_files, out_path, processes, previous_entries)
+        if duplicates:
+            outputs = _find_outputs(base_input_path, out_path, files_to_open, input_dirs)
+            files_to_convert_again = []
+            for original, copies in duplicates.items():
+                (_, dependencies, _) = results[original]
+                if {os.path.normpath(x) for x in dependencies} != {os.path.normpath(original)}:
+                    # conversion used other files, which can differ for the duplicate
+                    files_to_convert_again += copies
+                    continue
+                for duplicate in copies:
+                    results[duplicate] = _copy_outputs(base_input_path, out_path,
+                                                       outputs[_get_input_key(base_input_path, original)],
+                                                       original, results[original], duplicate)
+                pbar.update(len(copies))
+            results.update(_run_conversion(pool, pbar, base_input_path, files_to_convert_again, out_path, processes,
+                                           previous_entries))
     pbar.close()
+    results = [results[f] for f in files_to_convert]
 
-    skipped_resources = [(files_to_open[i], exc) for i, exc in enumerate(results) if isinstance(exc, Exception)]
+    skipped_reports = []
+    skipped_resources = [(files_to_convert[i], exc) for i, (exc, _, _) in enumerate(results)
+                         if isinstance(exc, Exception)]
     if skipped_resources:
         skipped_map = defaultdict(lambda: list())
         for name, ex in skipped_resources:
@@ -61,11 +391,28 @@ def convert_all(path, out_path):
             if path_suffix.startswith('/'):
                 path_suffix = path_suffix[1:]
             skipped_txt_output_path = os.path.join(out_path, path_suffix, 'skipped.txt')
+            skipped_reports.append(os.path.relpath(skipped_txt_output_path, out_path).replace('\\', '/'))
             os.makedirs(os.path.dirname(skipped_txt_output_path), exist_ok=True)
             skipped.sort(key=lambda x: x[0])
             with open(skipped_txt_output_path, 'w') as f:
                 for item in skipped:
                     f.write("%s\t\t%s\n" % item)
 
+    outputs = None
+    if incremental or settings.save_conversion_report:
+        outputs = _find_outputs(base_input_path, out_path, files_to_open, input_dirs)
+    if incremental:
+        converted = [(files_to_convert[i], dependencies, stats)
+                     for i, (exc, dependencies, stats) in enumerate(results) if not isinstance(exc, Exception)]
+        _save_incremental_manifest(base_input_path, out_path, outputs, converted, unchanged_entries, skipped_reports)
+    if settings.save_conversion_report:
+        _save_conversion_report(base_input_path, out_path, outputs, files_to_convert, results,
+                                summary={'total_time': round(time.time() - start_time, 3),
+                                         'processes': processes,
+                                         'converted_files': len(files_to_convert),
+                                         'duplicate_files': sum(1 for (_, _, stats) in results
+                                                                if stats.get('duplicate_of')),
+                                         'unchanged_files': len(unchanged_entries)})
+
     print(f'Finished. Execution time: {time.time() - start_time} seconds')
     print(f'Support me :) >>>  https://www.buymeacoffee.com/andygura <<<')
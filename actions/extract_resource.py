@@ -0,0 +1,29 @@
+import os
+
+import settings
+from library import require_resource
+from serializers import get_serializer
+
+
+# id example: /media/data/nfs/SIMDATA/CARFAMS/LDIABL.CFM__children/1/data/children/0
+def extract_resource(resource_id: str, out_path: str):
+    from library.loader import files_cache
+    # archive children, which are not on the way to requested resource, are not parsed at all. Setting is restored
+    # and lazily parsed files are dropped from the cache afterwards, so they do not leak to other resource requests
+    previous_lazy_archive_children = settings.lazy_archive_children
+    previously_cached = set(files_cache.entries)
+    settings.lazy_archive_children = True
+    try:
+        (id, block, data), _ = require_resource(resource_id)
+        if block is None:
+            raise Exception(f'Resource {resource_id} not found')
+        (file_path, _, resource_path) = id.partition('__')
+        path = os.path.join(str(out_path), os.path.basename(file_path), *[x for x in resource_path.split('/') if x])
+        serializer = get_serializer(block, data)
+        serializer.serialize(data, path, id=id, block=block)
+    finally:
+        settings.lazy_archive_children = previous_lazy_archive_children
+        if not previous_lazy_archive_children:
+            for name in set(files_cache.entries) - previously_cached:
+                files_cache.remove(name)
+    print('Finished!')
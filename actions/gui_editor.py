@@ -1,7 +1,6 @@
 import os
 import tempfile
 import traceback
-from copy import deepcopy
 from distutils.dir_util import copy_tree
 from itertools import chain
 from logging import warning
@@ -12,9 +11,11 @@ import eel
 
 import settings
 from library import require_file, require_resource
-from library.loader import clear_file_cache
+from library.loader import clear_file_cache, files_cache
+from library.utils.buffer_utils import materialize_views, copy_data
 from library.utils.file_utils import remove_file_or_directory
 from library.utils.file_utils import start_file
+from library.utils.file_utils import pack_to_file
 from serializers import get_serializer
 from serializers.misc.json_utils import convert_bytes, serialize_exceptions
 
@@ -66,6 +67,10 @@ def run_gui_editor(file_path):
                 if (force_reload):
                     clear_file_cache(path)
                 (name, block, data) = require_file(path)
+                # opened file is edited in memory, it should not be evicted from cache
+                if current_file_name is not None:
+                    files_cache.unpin(current_file_name)
+                files_cache.pin(name)
                 current_file_name = name
                 current_file_data = data
                 current_file_block = block
@@ -98,9 +103,9 @@ def run_gui_editor(file_path):
         @eel.expose
         def save_file(path: str, changes: Dict):
             __apply_delta_to_resource(current_file_name, current_file_data, changes)
-            bts = current_file_block.pack(current_file_data)
-            with open(path, 'wb') as file:
-                file.write(bts)
+            # data may reference memory-mapped file, which is going to be overwritten
+            materialize_views(current_file_data)
+            pack_to_file(current_file_block, current_file_data, path)
             clear_file_cache(path)
             return render_data(current_file_data)
 
@@ -134,7 +139,7 @@ def run_gui_editor(file_path):
         # returns file list and flag is it possible to deserialize files back
         def serialize_reversible(id: str, changes: Dict):
             (id, res_block, resource), _ = require_resource(id)
-            resource = deepcopy(resource)
+            resource = copy_data(resource)
             __apply_delta_to_resource(id, resource, changes)
             serializer = get_serializer(res_block, resource)
             path = os.path.join(static_path, 'resources_edit', *id.split('/'))
@@ -150,7 +155,7 @@ def run_gui_editor(file_path):
         @eel.expose
         def serialize_resource_tmp(id: str, changes: Dict, settings_patch={}):
             (_, res_block, resource), _ = require_resource(id)
-            resource = deepcopy(resource)
+            resource = copy_data(resource)
             __apply_delta_to_resource(id, resource, changes)
             serializer = get_serializer(res_block, resource)
             path = os.path.join(static_path, 'resources_tmp', *id.split('/'))
@@ -1 +1 @@
-from .loader import require_resource, require_file, probe_block_class
+from .loader import require_resource, require_file, probe_block_class, register_block_class
@@ -12,9 +12,20 @@ class BaseContext:
         self.block = block
         self.parent = parent
         self.children = []
+        self._cached_values = None
         if self.parent:
             self.parent.children.append(self)
 
+    # returns value, computed only once per context. Used by blocks to keep lookup indexes while reading/writing
+    def get_cached(self, key: str, compute):
+        if self._cached_values is None:
+            self._cached_values = dict()
+        try:
+            return self._cached_values[key]
+        except KeyError:
+            value = self._cached_values[key] = compute()
+            return value
+
     def data(self, local_path: str):
         data_path = local_path.split('/')
         entry = self._data
@@ -39,7 +50,37 @@ class ReadContext(BaseContext):
 
 
 class WriteContext(BaseContext):
-    def __init__(self, result: bytes = b'', name: str = '', data=None, block=None, parent=None):
+    # buffer is the output, shared by blocks during single write. If not provided, parent's buffer is used
+    def __init__(self, buffer: bytearray = None, name: str = '', data=None, block=None, parent=None):
         super().__init__(name=name, data=data, block=block, parent=parent)
-        self.result = result
-        self.write_start_offset = len(result)
+        if buffer is None and parent is not None:
+            buffer = parent.buffer
+        self.buffer = buffer
+        self.write_start_offset = len(buffer) if buffer is not None else 0
+        # estimated packed sizes, shared by all contexts of single write: (block id, data id) -> (data, size). Data is
+        # referenced here, so its id cannot be taken by another object until write is finished
+        self.packed_sizes = parent.packed_sizes if parent is not None else dict()
+
+    # estimated packed size of data, computed only once per write. Only lists and dicts are memoized: they are
+    # identified by id, scalar values are cheap to estimate anyway
+    def get_packed_size(self, block, data) -> int:
+        if not isinstance(data, (dict, list)):
+            return block.estimate_packed_size(data, self)
+        key = (id(block), id(data))
+        try:
+            return self.packed_sizes[key][1]
+        except KeyError:
+            size = block.estimate_packed_size(data, self)
+            self.packed_sizes[key] = (data, size)
+            return size
+
+    # stores packed size, which is already known, e.g. planned by archive block
+    def set_packed_size(self, block, data, size: int):
+        self.packed_sizes[(id(block), id(data))] = (data, size)
+
+    # bytes, written by this block so far
+    @property
+    def result(self) -> bytes:
+        if self.buffer is None:
+            return b''
+        return bytes(self.buffer[self.write_start_offset:])
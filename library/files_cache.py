@@ -0,0 +1,110 @@
+import sys
+from collections import OrderedDict
+from typing import Tuple
+
+import settings
+from library.utils.lazy_list import LazyList
+
+
+# roughly estimates, how much memory unpacked data takes. Lists of scalars are estimated by their first item, so
+# estimation does not iterate over huge arrays of pixels/vertices
+def estimate_data_size(data) -> int:
+    size = 0
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            size += sys.getsizeof(item)
+            stack.extend(item.values())
+        elif isinstance(item, LazyList):
+            # do not load items only for estimation
+            size += sys.getsizeof(item)
+            stack.extend(item.loaded_items())
+        elif isinstance(item, (list, tuple)):
+            size += sys.getsizeof(item)
+            if not item:
+                continue
+            if isinstance(item[0], (int, float, bool)) or item[0] is None:
+                size += len(item) * sys.getsizeof(item[0])
+            else:
+                stack.extend(item)
+        elif hasattr(item, 'nbytes'):
+            # numpy array or memoryview
+            size += item.nbytes
+        else:
+            size += sys.getsizeof(item)
+    return size
+
+
+# LRU cache of unpacked files. Total estimated size of unpacked data is limited by settings.files_cache_max_size,
+# least recently used files are evicted first. Pinned files (e.g. opened in GUI) are never evicted
+class FilesCache:
+
+    def __init__(self):
+        # name -> (block, data, estimated size)
+        self.entries = OrderedDict()
+        self.pinned = set()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name: str) -> Tuple["DataBlock", dict]:
+        entry = self.entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        self.entries.move_to_end(name)
+        return entry[0], entry[1]
+
+    def put(self, name: str, block: "DataBlock", data):
+        self.remove(name)
+        size = estimate_data_size(data)
+        self.entries[name] = (block, data, size)
+        self.size += size
+        self.evict(keep=name)
+
+    def remove(self, name: str):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def evict(self, keep: str = None):
+        max_size = settings.files_cache_max_size
+        if not max_size or self.size <= max_size:
+            return
+        for name in [name for name in self.entries if name != keep and name not in self.pinned]:
+            self.remove(name)
+            self.evictions += 1
+            if self.size <= max_size:
+                return
+
+    def pin(self, name: str):
+        self.pinned.add(name)
+
+    def unpin(self, name: str):
+        self.pinned.discard(name)
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.pinned.clear()
+        self.size = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'files': len(self.entries),
+            'size': self.size,
+            'pinned': len(self.pinned),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
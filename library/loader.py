@@ -1,121 +1,138 @@
+from contextlib import contextmanager
+from importlib import import_module
 from io import BufferedReader, BytesIO, SEEK_CUR
+from itertools import chain
 from os.path import getsize
 from typing import Tuple
 
+import settings
+from library.context import ReadContext
+from library.files_cache import FilesCache
+
+
+# Block classes are detected by file name suffix, 4-character header string or the first header byte (resource id).
+# Classes are referenced by "module.ClassName" strings and imported only when matched: by using local imports we
+# dramatically increase performance, because we spawn process per file, and it doesn't need to load all those classes
+# every time
+
+# file extension -> list of (suffix, block class, is case sensitive)
+_suffix_map = {}
+# suffixes without extension in the file name part, checked for every file: list of (suffix, block class, is case
+# sensitive)
+_suffixes_without_extension = []
+# header string -> list of (block class, file path suffix or None)
+_header_str_map = {}
+# first byte -> block class. Compressed map is checked first for headers with 0xFB as the second byte
+_resource_id_map = {}
+_compressed_resource_id_map = {}
+_imported_classes = {}
+
+
+# extension of the last path component with the dot, or empty string
+def _get_extension(path: str) -> str:
+    name = path[max(path.rfind('/'), path.rfind('\\')) + 1:]
+    dot_index = name.rfind('.')
+    return name[dot_index:] if dot_index != -1 else ''
+
+
+# registers block class for probe_block_class. Block class can be either a class or a string "module.ClassName" for
+# lazy import. When block class is not provided, works as class decorator:
+# @register_block_class(header_strings=['ABCD'])
+# class MyBlock(DeclarativeCompoundBlock): ...
+def register_block_class(block_class=None, suffixes=(), case_insensitive_suffixes=(), header_strings=(),
+                         resource_ids=(), compressed_resource_ids=(), header_string_path_suffix: str = None):
+    def register(cls):
+        for suffix, case_sensitive in chain(((x, True) for x in suffixes),
+                                            ((x.upper(), False) for x in case_insensitive_suffixes)):
+            extension = _get_extension(suffix)
+            if extension:
+                _suffix_map.setdefault(extension, []).append((suffix, cls, case_sensitive))
+            else:
+                _suffixes_without_extension.append((suffix, cls, case_sensitive))
+        for header_str in header_strings:
+            _header_str_map.setdefault(header_str, []).append((cls, header_string_path_suffix))
+        for resource_id in resource_ids:
+            _resource_id_map[resource_id] = cls
+        for resource_id in compressed_resource_ids:
+            _compressed_resource_id_map[resource_id] = cls
+        return cls
+
+    if block_class is None:
+        return register
+    return register(block_class)
+
+
+def _resolve_block_class(block_class):
+    if not isinstance(block_class, str):
+        return block_class
+    cls = _imported_classes.get(block_class)
+    if cls is None:
+        (module_name, class_name) = block_class.rsplit('.', 1)
+        cls = getattr(import_module(module_name), class_name)
+        _imported_classes[block_class] = cls
+    return cls
+
+
+register_block_class('resources.test_resource.TestResource', suffixes=['nfsrc_test_resource.bin'])
+register_block_class('resources.eac.archives.SoundBank', suffixes=['.BNK'])
+register_block_class('resources.eac.car_specs.CarPerformanceSpec', suffixes=['.PBS_UNCOMPRESSED'])
+register_block_class('resources.eac.car_specs.CarSimplifiedPerformanceSpec', suffixes=['.PDN_UNCOMPRESSED'])
+register_block_class('resources.eac.configs.TnfsConfigDat', suffixes=['CONFIG.DAT'])
+register_block_class('resources.eac.geometries.GeoGeometry', case_insensitive_suffixes=['.GEO'])
+register_block_class('resources.eac.misc.DashDeclarationFile', header_strings=['#ver'], header_string_path_suffix='INFO')
+register_block_class('resources.eac.audios.AsfAudio', header_strings=['1SNh'])
+register_block_class('resources.eac.videos.FfmpegSupportedVideo', header_strings=['kVGT', 'SCHl'])
+register_block_class('resources.eac.archives.ShpiBlock', header_strings=['SHPI'])
+register_block_class('resources.eac.archives.WwwwBlock', header_strings=['wwww'])
+register_block_class('resources.eac.fonts.FfnFont', header_strings=['FNTF'])
+register_block_class('resources.eac.geometries.OripGeometry', header_strings=['ORIP'])
+register_block_class('resources.eac.audios.EacsAudioFile', header_strings=['EACS'])
+register_block_class('resources.eac.archives.BigfBlock', header_strings=['BIGF'])
+register_block_class('resources.eac.palettes.Palette24BitDos', resource_ids=[0x22])
+register_block_class('resources.eac.palettes.Palette24Bit', resource_ids=[0x24])
+register_block_class('resources.eac.palettes.Palette16BitDos', resource_ids=[0x29])
+register_block_class('resources.eac.palettes.Palette32Bit', resource_ids=[0x2A])
+register_block_class('resources.eac.palettes.Palette16Bit', resource_ids=[0x2D])
+register_block_class('resources.eac.misc.ShpiText', resource_ids=[0x6F])
+register_block_class('resources.eac.bitmaps.Bitmap16Bit0565', resource_ids=[0x78])
+register_block_class('resources.eac.bitmaps.Bitmap4Bit', resource_ids=[0x7A])
+register_block_class('resources.eac.bitmaps.Bitmap8Bit', resource_ids=[0x7B])
+register_block_class('resources.eac.palettes.PaletteReference', resource_ids=[0x7C])
+register_block_class('resources.eac.bitmaps.Bitmap32Bit', resource_ids=[0x7D])
+register_block_class('resources.eac.bitmaps.Bitmap16Bit1555', resource_ids=[0x7E])
+register_block_class('resources.eac.bitmaps.Bitmap24Bit', resource_ids=[0x7F])
+register_block_class('resources.eac.maps.TriMap', resource_ids=[0x11])
+# QFS1
+register_block_class('resources.eac.archives.RefPackBlock', compressed_resource_ids=[0x10, 0x11])
+# AL2.QFS
+register_block_class('resources.eac.archives.Qfs2Block', compressed_resource_ids=[0b0100_0110])
+# AL1.QFS
+register_block_class('resources.eac.archives.Qfs3Block', compressed_resource_ids=[0b0011_0000, 0b0011_0010,
+                                                                                  0b0011_0100, 0b0011_0001,
+                                                                                  0b0011_0011, 0b0011_0101])
+
 
-# this looks like a mess, but it is intended to be like that: by using local imports we dramatically increase
-# performance, because we spawn process per file, and it doesn't need to load all those classes every time
 def _find_block_class(file_path: str, header_str: str, header_bytes: bytes):
     if file_path:
-        # test resource
-        if file_path.endswith('nfsrc_test_resource.bin'):
-            from resources.test_resource import TestResource
-            return TestResource
-        elif file_path.endswith('.BNK'):
-            from resources.eac.archives import SoundBank
-            return SoundBank
-        elif file_path.endswith('.PBS_UNCOMPRESSED'):
-            from resources.eac.car_specs import CarPerformanceSpec
-            return CarPerformanceSpec
-        elif file_path.endswith('.PDN_UNCOMPRESSED'):
-            from resources.eac.car_specs import CarSimplifiedPerformanceSpec
-            return CarSimplifiedPerformanceSpec
-        elif file_path.endswith('CONFIG.DAT'):
-            from resources.eac.configs import TnfsConfigDat
-            return TnfsConfigDat
-        elif file_path.upper().endswith('.GEO'):
-            from resources.eac.geometries import GeoGeometry
-            return GeoGeometry
+        extension = _get_extension(file_path)
+        candidates = _suffix_map.get(extension, ()) if extension else ()
+        if extension != extension.upper():
+            candidates = chain(candidates, _suffix_map.get(extension.upper(), ()))
+        candidates = chain(candidates, _suffixes_without_extension)
+        for (suffix, block_class, case_sensitive) in candidates:
+            if (file_path if case_sensitive else file_path.upper()).endswith(suffix):
+                return block_class
     if header_str:
-        if file_path and header_str == '#ver' and file_path.endswith('INFO'):
-            from resources.eac.misc import DashDeclarationFile
-            return DashDeclarationFile
-        elif header_str == '1SNh':
-            from resources.eac.audios import AsfAudio
-            return AsfAudio
-        elif header_str in ['kVGT', 'SCHl']:
-            from resources.eac.videos import FfmpegSupportedVideo
-            return FfmpegSupportedVideo
-        elif header_str == 'SHPI':
-            from resources.eac.archives import ShpiBlock
-            return ShpiBlock
-        elif header_str == 'wwww':
-            from resources.eac.archives import WwwwBlock
-            return WwwwBlock
-        elif header_str == 'FNTF':
-            from resources.eac.fonts import FfnFont
-            return FfnFont
-        elif header_str == 'ORIP':
-            from resources.eac.geometries import OripGeometry
-            return OripGeometry
-        elif header_str == 'EACS':
-            from resources.eac.audios import EacsAudioFile
-            return EacsAudioFile
-        elif header_str == 'BIGF':
-            from resources.eac.archives import BigfBlock
-            return BigfBlock
-    try:
-        resource_id = header_bytes[0]
-        if resource_id == 0x22:
-            from resources.eac.palettes import Palette24BitDos
-            return Palette24BitDos
-        elif resource_id == 0x24:
-            from resources.eac.palettes import Palette24Bit
-            return Palette24Bit
-        elif resource_id == 0x29:
-            from resources.eac.palettes import Palette16BitDos
-            return Palette16BitDos
-        elif resource_id == 0x2A:
-            from resources.eac.palettes import Palette32Bit
-            return Palette32Bit
-        elif resource_id == 0x2D:
-            from resources.eac.palettes import Palette16Bit
-            return Palette16Bit
-        elif resource_id == 0x6F:
-            from resources.eac.misc import ShpiText
-            return ShpiText
-        elif resource_id == 0x78:
-            from resources.eac.bitmaps import Bitmap16Bit0565
-            return Bitmap16Bit0565
-        elif resource_id == 0x7A:
-            from resources.eac.bitmaps import Bitmap4Bit
-            return Bitmap4Bit
-        elif resource_id == 0x7B:
-            from resources.eac.bitmaps import Bitmap8Bit
-            return Bitmap8Bit
-        elif resource_id == 0x7C:
-            from resources.eac.palettes import PaletteReference
-            return PaletteReference
-        elif resource_id == 0x7D:
-            from resources.eac.bitmaps import Bitmap32Bit
-            return Bitmap32Bit
-        elif resource_id == 0x7E:
-            from resources.eac.bitmaps import Bitmap16Bit1555
-            return Bitmap16Bit1555
-        elif resource_id == 0x7F:
-            from resources.eac.bitmaps import Bitmap24Bit
-            return Bitmap24Bit
-        # QFS1
-        # if resource_id & 0b0001_0000:
-        elif header_bytes[1] == 0xfb and (resource_id & 0b1111_1110) == 0x10:
-            from resources.eac.archives import RefPackBlock
-            return RefPackBlock
-        # AL2.QFS
-        elif header_bytes[1] == 0xfb and resource_id == 0b0100_0110:
-            from resources.eac.archives import Qfs2Block
-            return Qfs2Block
-        # AL1.QFS
-        elif header_bytes[1] == 0xfb and resource_id in [0b0011_0000, 0b0011_0010, 0b0011_0100, 0b0011_0001,
-                                                         0b0011_0011,
-                                                         0b0011_0101]:
-            from resources.eac.archives import Qfs3Block
-            return Qfs3Block
-        elif resource_id == 0x11:
-            from resources.eac.maps import TriMap
-            return TriMap
-    except IndexError:
-        pass
-    return None
+        for (block_class, path_suffix) in _header_str_map.get(header_str, ()):
+            if path_suffix is None or (file_path and file_path.endswith(path_suffix)):
+                return block_class
+    if not header_bytes:
+        return None
+    if len(header_bytes) > 1 and header_bytes[1] == 0xfb:
+        block_class = _compressed_resource_id_map.get(header_bytes[0])
+        if block_class is not None:
+            return block_class
+    return _resource_id_map.get(header_bytes[0])
 
 
 def probe_block_class(binary_file: [BufferedReader, BytesIO], file_path: str = None, resources_to_pick=None):
@@ -125,7 +142,7 @@ def probe_block_class(binary_file: [BufferedReader, BytesIO], file_path: str = N
         header_str = header_bytes.decode('utf8')
     except UnicodeDecodeError:
         header_str = None
-    block_class = _find_block_class(file_path, header_str, header_bytes)
+    block_class = _resolve_block_class(_find_block_class(file_path, header_str, header_bytes))
     if block_class and (not resources_to_pick or block_class in resources_to_pick):
         return block_class
     raise NotImplementedError('Don`t have parser for such resource')
@@ -149,23 +166,58 @@ def require_resource(id: str) -> Tuple[Tuple[str, "DataBlock", dict], Tuple[str,
 # not shared between processes: in most cases if file requires another resource, it is in the same file, or it
 # requires one external file multiple times. It will be more time-consuming to serialize/deserialize it for sharing
 # between processes than load some file multiple times. + we avoid potential memory leaks
-files_cache = {}
+files_cache = FilesCache()
+
+
+def get_file_id(path: str) -> str:
+    return path.replace('\\', '/').replace(':', '---DRIVE')
 
 
 def clear_file_cache(path: str):
+    files_cache.remove(get_file_id(path))
+
+
+# paths of files, required inside track_required_files block. None if not tracking
+_required_files = None
+
+
+# collects paths of all files, required inside the block (including ones, taken from the cache). Used to find out,
+# which files the conversion of some file depends on
+@contextmanager
+def track_required_files():
+    global _required_files
+    previous = _required_files
+    _required_files = set()
     try:
-        del files_cache[path.replace('\\', '/')]
-    except KeyError:
-        pass
+        yield _required_files
+    finally:
+        if previous is not None:
+            previous.update(_required_files)
+        _required_files = previous
 
 
 def require_file(path: str) -> Tuple[str, "DataBlock", dict]:
-    name = path.replace('\\', '/').replace(':', '---DRIVE')
-    (block, data) = files_cache.get(name, (None, None))
+    if _required_files is not None:
+        _required_files.add(path)
+    name = get_file_id(path)
+    (block, data) = files_cache.get(name)
     if block is None or data is None:
-        with open(path, 'rb', buffering=100 * 1024 * 1024) as bdata:
-            block_class = probe_block_class(bdata, path)
+        from library.parse_cache import load_cached, store_cached
+        cached = load_cached(path)
+        if cached is not None:
+            (block_class, data) = cached
             block = block_class()
-            data = block.unpack(bdata, name=name, read_bytes_amount=getsize(path))
-            files_cache[name] = (block, data)
+        else:
+            if settings.mmap_input_files:
+                from library.utils.buffer_utils import MmapFileReader
+                file = MmapFileReader(path)
+            else:
+                file = open(path, 'rb', buffering=100 * 1024 * 1024)
+            with file as bdata:
+                block_class = probe_block_class(bdata, path)
+                block = block_class()
+                # own root context per file: otherwise contexts of all ever parsed files are kept in memory
+                data = block.unpack(bdata, ctx=ReadContext(), name=name, read_bytes_amount=getsize(path))
+            store_cached(path, block_class, data)
+        files_cache.put(name, block, data)
     return name, block, data
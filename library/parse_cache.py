@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+from io import BytesIO
+from typing import Tuple, Optional, Any
+
+import settings
+
+# Persistent cache of parsed files. Entry is stored as pickle (protocol 5) of tuple (block class, unpacked data).
+# bytearrays, numpy arrays and memoryview-s are stored out-of-band right after pickle stream, so loading them does not
+# copy data again. bytes payloads are stored inside pickle stream. Entries are placed to directory, named by parser
+# fingerprint: any change in block definitions or parsing settings makes old entries unreachable
+
+# file layout: magic, buffers count (4 bytes), pickle length (8 bytes), buffer lengths (8 bytes each), pickle, buffers
+MAGIC = b'NFSRC_PC'
+
+_parser_fingerprint = None
+
+
+class _Pickler(pickle.Pickler):
+
+    # memoryview-s (see settings.mmap_input_files) cannot be pickled by default, they are stored out-of-band
+    def reducer_override(self, obj):
+        if isinstance(obj, memoryview):
+            return memoryview, (pickle.PickleBuffer(obj),)
+        return NotImplemented
+
+
+def get_parser_fingerprint() -> str:
+    global _parser_fingerprint
+    if _parser_fingerprint is None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha1()
+        for package in ['library', 'resources']:
+            for subdir, dirs, files in os.walk(os.path.join(project_root, package)):
+                dirs.sort()
+                for file_name in sorted(f for f in files if f.endswith('.py')):
+                    file_path = os.path.join(subdir, file_name)
+                    digest.update(os.path.relpath(file_path, project_root).replace('\\', '/').encode('utf8'))
+                    with open(file_path, 'rb') as f:
+                        digest.update(f.read())
+        # settings, which affect unpacked data
+        digest.update(repr((settings.images__unpack_to_numpy_arrays, settings.mmap_input_files)).encode('utf8'))
+        _parser_fingerprint = digest.hexdigest()[:16]
+    return _parser_fingerprint
+
+
+def _get_entry_path(path: str) -> Optional[str]:
+    # lazy archive children are not stored: storing them would parse everything
+    if not settings.parse_cache_directory or settings.lazy_archive_children:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return os.path.join(settings.parse_cache_directory, get_parser_fingerprint(),
+                        hashlib.sha1(key.encode('utf8')).hexdigest() + '.pickle')
+
+
+def load_cached(path: str) -> Optional[Tuple[type, Any]]:
+    entry_path = _get_entry_path(path)
+    if entry_path is None:
+        return None
+    try:
+        with open(entry_path, 'rb') as f:
+            raw = bytearray(f.read())
+    except OSError:
+        return None
+    if raw[:len(MAGIC)] != MAGIC:
+        return None
+    try:
+        view = memoryview(raw)
+        position = len(MAGIC)
+        buffers_count = int.from_bytes(view[position:position + 4], 'little')
+        pickle_length = int.from_bytes(view[position + 4:position + 12], 'little')
+        position += 12
+        buffer_lengths = [int.from_bytes(view[position + 8 * i:position + 8 * i + 8], 'little')
+                          for i in range(buffers_count)]
+        position += 8 * buffers_count
+        pickle_data = view[position:position + pickle_length]
+        position += pickle_length
+        buffers = []
+        for length in buffer_lengths:
+            buffers.append(view[position:position + length])
+            position += length
+        return pickle.loads(pickle_data, buffers=buffers)
+    except Exception:
+        # broken or incompatible entry, will be overwritten after parsing
+        return None
+
+
+def store_cached(path: str, block_class: type, data):
+    entry_path = _get_entry_path(path)
+    if entry_path is None:
+        return
+    buffers = []
+    try:
+        stream = BytesIO()
+        _Pickler(stream, protocol=5, buffer_callback=buffers.append).dump((block_class, data))
+        pickle_data = stream.getbuffer()
+    except Exception:
+        # data cannot be pickled, just do not cache it
+        return
+    buffers = [b.raw() for b in buffers]
+    # write to temporary file first: other processes may read the same entry at the same time
+    tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(buffers).to_bytes(4, 'little'))
+            f.write(len(pickle_data).to_bytes(8, 'little'))
+            for buffer in buffers:
+                f.write(buffer.nbytes.to_bytes(8, 'little'))
+            f.write(pickle_data)
+            for buffer in buffers:
+                f.write(buffer)
+        os.replace(tmp_path, entry_path)
+    except OSError:
+        # cache is optional, failing to write it should not break parsing
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -1,11 +1,12 @@
 from abc import ABC
 from io import BufferedReader, BytesIO
 from math import ceil
+from struct import Struct
 from typing import Dict, Tuple, Any
 
 from library.context import ReadContext, WriteContext
 from library.exceptions import EndOfBufferException
-from library.read_blocks.basic import DataBlock, DataBlockWithChildren
+from library.read_blocks.basic import DataBlock, DataBlockWithChildren, get_static_length, resolve_declared_length
 from library.read_blocks.numbers import IntegerBlock
 
 
@@ -15,6 +16,7 @@ class ArrayBlock(DataBlockWithChildren, DataBlock, ABC):
         super().__init__(**kwargs)
         self.child = child
         self._length = length
+        self._child_read_plan = None
 
     @property
     def schema(self) -> Dict:
@@ -64,13 +66,7 @@ class ArrayBlock(DataBlockWithChildren, DataBlock, ABC):
         return _multiply_docs(length_doc, child_size_doc)
 
     def resolve_length(self, ctx):
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
-            self_len = self_len(ctx)
-        return self_len
+        return resolve_declared_length(self._length, ctx)
 
     def get_child_block_with_data(self, unpacked_data: list, name: str) -> Tuple['DataBlock', Any]:
         return self.child, unpacked_data[int(name)]
@@ -78,11 +74,8 @@ class ArrayBlock(DataBlockWithChildren, DataBlock, ABC):
     def new_data(self):
         if self.required_value:
             return self.required_value
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
+        self_len = get_static_length(self._length)
+        if self_len is None:
             return []
         return [self.child.new_data()] * self_len
 
@@ -96,29 +89,106 @@ class ArrayBlock(DataBlockWithChildren, DataBlock, ABC):
             if len(res) < self_len:
                 raise EndOfBufferException()
             return res
+        child_plan = self.child_read_plan
+        if child_plan:
+            # all items have the same static size: read them at once and decode with struct
+            (child_struct, child_convert, validated_child) = child_plan
+            raw = buffer.read(child_struct.size * self_len)
+            if len(raw) < child_struct.size * self_len:
+                raise EndOfBufferException()
+            if child_convert is None and validated_child is None:
+                res.extend(values[0] for values in child_struct.iter_unpack(raw))
+                return res
+            for i, values in enumerate(child_struct.iter_unpack(raw)):
+                item = values[0] if child_convert is None else child_convert(values, 0, self_ctx, str(i))
+                if validated_child is not None:
+                    validated_child.validate_after_read(item, self_ctx, str(i))
+                res.append(item)
+            return res
         for i in range(self_len):
             res.append(self.child.unpack(buffer=buffer, ctx=self_ctx, name=str(i)))
         return res
 
-    def estimate_packed_size(self, data, ctx: WriteContext = None):
+    # compiled read plan of child block: (struct, convert, block to validate or None). False if child cannot be
+    # read with struct module. Cached on first read, because some blocks replace child after initialization
+    @property
+    def child_read_plan(self):
+        if self._child_read_plan is None:
+            plan = self.child.get_struct_read_plan() if self.child is not None else None
+            if plan is None:
+                self._child_read_plan = False
+            else:
+                (child_fmt, _, child_convert, _) = plan
+                child_struct = Struct('<' + child_fmt)
+                self._child_read_plan = (child_struct,
+                                         child_convert,
+                                         self.child if self.child.validates_after_read else None
+                                         ) if child_struct.size > 0 else False
+        return self._child_read_plan
+
+    def get_struct_read_plan(self):
+        self_len = get_static_length(self._length)
+        if type(self).read is not ArrayBlock.read or self.child is None or self_len is None:
+            return None
+        child_plan = self.child.get_struct_read_plan()
+        if child_plan is None:
+            return None
+        (child_fmt, child_values_count, child_convert, child_needs_ctx) = child_plan
+        validated_child = self.child if self.child.validates_after_read else None
+        needs_ctx = child_needs_ctx or validated_child is not None
+        child = self.child
+
+        def convert(values, index, ctx, name):
+            if child_convert is None and validated_child is None:
+                return list(values[index:index + child_values_count * self_len])
+            res = []
+            self_ctx = ReadContext(data=res, name=name, parent=ctx) if needs_ctx else ctx
+            for i in range(self_len):
+                item = (values[index + i * child_values_count] if child_convert is None
+                        else child_convert(values, index + i * child_values_count, self_ctx, str(i)))
+                if validated_child is not None:
+                    child.validate_after_read(item, self_ctx, str(i))
+                res.append(item)
+            return res
+
+        return child_fmt * self_len, child_values_count * self_len, convert, needs_ctx
+
+    def _estimate_items_size(self, data, count: int, ctx: WriteContext = None):
+        child = self.child
+        if child.__class__ == IntegerBlock:
+            return count * child.length
         res = 0
-        for item in data:
-            res += self.child.estimate_packed_size(data=item, ctx=ctx)
+        for i in range(count):
+            res += child.estimate_packed_size(data=data[i], ctx=ctx)
         return res
 
+    def estimate_packed_size(self, data, ctx: WriteContext = None):
+        return self._estimate_items_size(data, len(data), ctx)
+
     def offset_to_child_when_packed(self, data, child_name: str, ctx: WriteContext = None):
         index = int(child_name)
         if index >= len(data):
             raise IndexError()
-        return self.estimate_packed_size(data[:index], ctx)
+        return self._estimate_items_size(data, index, ctx)
 
-    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
+    def _write_items_into(self, buffer: bytearray, data, ctx: WriteContext = None):
         if self.child.__class__ == IntegerBlock and self.child.length == 1 and not self.child.is_signed:
-            return bytes(data)
-        res = bytes()
+            buffer += bytes(data)
+            return
+        child = self.child
         for i, item in enumerate(data):
-            res += self.child.pack(data=item, ctx=ctx, name=str(i))
-        return res
+            child.write_into(buffer, item, ctx=ctx, name=str(i))
+
+    def write_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        if type(self).write is not ArrayBlock.write:
+            # custom write logic
+            return super().write_into(buffer, data, ctx, name)
+        self._write_items_into(buffer, data, ctx)
+
+    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
+        buffer = bytearray()
+        self._write_items_into(buffer, data, ctx)
+        return bytes(buffer)
 
 
 class SubByteArrayBlock(DataBlock):
@@ -172,13 +242,7 @@ class SubByteArrayBlock(DataBlock):
             return f'ceil(({length_doc})*{self.bits_per_value}/8)'
 
     def resolve_length(self, ctx):
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
-            self_len = self_len(ctx)
-        return self_len
+        return resolve_declared_length(self._length, ctx)
 
     def get_child_block_with_data(self, unpacked_data: list, name: str) -> Tuple['DataBlock', Any]:
         return None, unpacked_data[int(name)]
@@ -186,18 +250,12 @@ class SubByteArrayBlock(DataBlock):
     def new_data(self):
         if self.required_value:
             return self.required_value
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
+        self_len = get_static_length(self._length)
+        if self_len is None:
             return []
         return [0] * self_len
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        self_len = self.resolve_length(ctx)
-        raw = buffer.read(ceil(self.bits_per_value * self_len / 8))
+    def _unpack_values(self, raw: bytes, self_len: int):
         bitstring = "".join([bin(x)[2:].rjust(8, "0") for x in raw])
         values = [int(bitstring[i * self.bits_per_value:(i + 1) * self.bits_per_value], 2)
                   for i in range(self_len)]
@@ -205,6 +263,19 @@ class SubByteArrayBlock(DataBlock):
             values = [self.value_deserialize_func(x) for x in values]
         return values
 
+    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
+             read_bytes_amount=None):
+        self_len = self.resolve_length(ctx)
+        raw = buffer.read(ceil(self.bits_per_value * self_len / 8))
+        return self._unpack_values(raw, self_len)
+
+    def get_struct_read_plan(self):
+        self_len = get_static_length(self._length)
+        if type(self).read is not SubByteArrayBlock.read or self_len is None:
+            return None
+        return (f'{ceil(self.bits_per_value * self_len / 8)}s', 1,
+                lambda values, index, ctx, name: self._unpack_values(values[index], self_len), False)
+
     def estimate_packed_size(self, data, ctx: WriteContext = None):
         return ceil(self.bits_per_value * len(data) / 8)
 
@@ -5,6 +5,7 @@ from typing import Dict, Any, Tuple, Literal
 from library.context import ReadContext, WriteContext
 from library.exceptions import DataIntegrityException, BlockDefinitionException, EndOfBufferException
 from library.utils import represent_value_as_str
+from library.utils.buffer_utils import read_view, StreamWriteBuffer
 
 
 class DataBlock(ABC):
@@ -49,6 +50,22 @@ class DataBlock(ABC):
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         pass
 
+    # For read fast paths only. If block always occupies the same amount of bytes and its data can be built from
+    # values, unpacked with python struct module, returns tuple (format, values_count, convert, needs_ctx), where:
+    # - format is a struct format string without byte order character (little-endian is always used)
+    # - values_count is an amount of values, which format produces
+    # - convert(values, index, ctx, name) builds block data from values, starting at index. None means that block data
+    # is the single value as is
+    # - needs_ctx is True if convert uses ctx for anything except attaching child contexts
+    # Blocks with custom read logic have to return None here
+    def get_struct_read_plan(self):
+        return None
+
+    # False if validate_after_read does nothing for this block, fast paths skip calling it in this case
+    @property
+    def validates_after_read(self) -> bool:
+        return bool(self.required_value) or type(self).validate_after_read is not DataBlock.validate_after_read
+
     def validate_after_read(self, value, ctx: ReadContext = root_read_ctx, name: str = ''):
         if self.required_value and value != self.required_value:
             raise DataIntegrityException(f'Expected {represent_value_as_str(self.required_value)}, '
@@ -62,10 +79,24 @@ class DataBlock(ABC):
         self.validate_after_read(v, ctx, name)
         return v
 
+    # appends packed data to the output buffer. Blocks with children override it, so the whole output is collected in
+    # a single buffer instead of concatenating bytes of every child
+    def write_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        buffer += self.write(data, ctx, name)
+
     ### final method, should never override
     def pack(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         return self.write(data, ctx, name)
 
+    ### final method, should never override
+    # writes packed data to the file-like object by chunks instead of building the whole output in memory. Stream
+    # should be seekable and readable: some blocks patch or read back already written data. Returns written length
+    def pack_into(self, stream, data, ctx: WriteContext = None, name: str = '') -> int:
+        buffer = StreamWriteBuffer(stream)
+        self.write_into(buffer, data, ctx, name)
+        buffer.flush()
+        return len(buffer)
+
 
 class DataBlockWithChildren(ABC):
 
@@ -83,6 +114,24 @@ class DataBlockWithChildren(ABC):
         return self.estimate_packed_size(data[:index], ctx)
 
 
+def _cut_off_length_documentation(length):
+    if isinstance(length, tuple):
+        (length, _) = length
+    return length
+
+
+# returns length, declared as a number (optionally with documentation), or None if it is calculated in runtime
+def get_static_length(length):
+    length = _cut_off_length_documentation(length)
+    return None if callable(length) else length
+
+
+# returns declared length, calling length function with read/write context if needed
+def resolve_declared_length(length, ctx):
+    length = _cut_off_length_documentation(length)
+    return length(ctx) if callable(length) else length
+
+
 class BytesBlock(DataBlock):
 
     def __init__(self, length, allow_negative_length=False, **kwargs):
@@ -112,22 +161,19 @@ class BytesBlock(DataBlock):
         }
 
     def resolve_length(self, ctx):
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
-            self_len = self_len(ctx)
-        return self_len
+        return resolve_declared_length(self._length, ctx)
+
+    def get_struct_read_plan(self):
+        self_len = get_static_length(self._length)
+        if type(self).read is not BytesBlock.read or self_len is None or self_len < 0:
+            return None
+        return f'{self_len}s', 1, None, False
 
     def new_data(self):
         if self.required_value:
             return self.required_value
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
+        self_len = get_static_length(self._length)
+        if self_len is None:
             return b''
         return bytes([0] * self_len)
 
@@ -139,7 +185,7 @@ class BytesBlock(DataBlock):
                 buffer.seek(self_len, SEEK_CUR)
                 return b''
             raise BlockDefinitionException('Cannot read bytes block with negative length')
-        res = buffer.read(self_len)
+        res = read_view(buffer, self_len)
         if len(res) < self_len:
             raise EndOfBufferException()
         return res
@@ -148,7 +194,7 @@ class BytesBlock(DataBlock):
         return len(data)
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
-        return data
+        return bytes(data)
 
 
 class SkipBlock(DataBlock):
@@ -1,9 +1,10 @@
 from abc import ABC
 from io import BufferedReader, BytesIO
+from struct import Struct
 from typing import Dict, List, Tuple, Any
 
 from library.context import ReadContext, WriteContext
-from library.exceptions import BlockDefinitionException, DataIntegrityException
+from library.exceptions import BlockDefinitionException, DataIntegrityException, EndOfBufferException
 from library.read_blocks.basic import DataBlock, DataBlockWithChildren
 
 
@@ -18,6 +19,7 @@ class CompoundBlock(DataBlockWithChildren, DataBlock, ABC):
         self.field_blocks = [(name, instance) for (name, instance, _) in self.fields]
         self.field_blocks_map = {name: res for (name, res, _) in self.fields}
         self.field_extras_map = {name: extra for (name, _, extra) in self.fields}
+        self._read_segments = None
 
     @property
     def schema(self) -> Dict:
@@ -75,20 +77,83 @@ class CompoundBlock(DataBlockWithChildren, DataBlock, ABC):
             res[name] = field.new_data()
         return res
 
+    # Groups fields into read segments. Every sequence of fields with static size, which can be read with python
+    # struct module, is compiled to a single segment (struct, steps, values count), where step is a tuple
+    # (name, values index, convert, block to validate or None, needs context). Other fields are read one by one as
+    # (None, field name, None)
+    def _compile_read_segments(self):
+        segments = []
+        fmt, values_count, steps = '', 0, []
+        for name, field in self.field_blocks:
+            plan = field.get_struct_read_plan()
+            if plan is None:
+                if steps:
+                    segments.append((Struct('<' + fmt), steps, values_count))
+                    fmt, values_count, steps = '', 0, []
+                segments.append((None, name, None))
+                continue
+            (field_fmt, field_values_count, convert, needs_ctx) = plan
+            steps.append((name, values_count, convert, field if field.validates_after_read else None, needs_ctx))
+            fmt += field_fmt
+            values_count += field_values_count
+        if steps:
+            segments.append((Struct('<' + fmt), steps, values_count))
+        return segments
+
+    @property
+    def read_segments(self):
+        if self._read_segments is None:
+            self._read_segments = self._compile_read_segments()
+        return self._read_segments
+
+    def get_struct_read_plan(self):
+        if type(self).read is not CompoundBlock.read:
+            return None
+        segments = self.read_segments
+        if len(segments) != 1 or segments[0][0] is None:
+            return None
+        (compiled, steps, values_count) = segments[0]
+        needs_ctx = any(validated_field is not None or field_needs_ctx
+                        for (_, _, _, validated_field, field_needs_ctx) in steps)
+
+        def convert(values, index, ctx, name):
+            res = dict()
+            self_ctx = ReadContext(data=res, name=name, block=self, parent=ctx) if needs_ctx else ctx
+            for (field_name, field_index, field_convert, validated_field, _) in steps:
+                value = (values[index + field_index] if field_convert is None
+                         else field_convert(values, index + field_index, self_ctx, field_name))
+                if validated_field is not None:
+                    validated_field.validate_after_read(value, self_ctx, field_name)
+                res[field_name] = value
+            return res
+
+        return compiled.format[1:], values_count, convert, needs_ctx
+
     def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
              read_bytes_amount=None):
         res = dict()
         self_ctx = ReadContext(buffer=buffer, data=res, name=name, block=self, parent=ctx,
                                read_bytes_amount=read_bytes_amount)
-        for name, field in self.field_blocks:
-            res[name] = field.unpack(buffer=buffer, ctx=self_ctx, name=name)
+        for (compiled, steps, _) in self.read_segments:
+            if compiled is None:
+                res[steps] = self.field_blocks_map[steps].unpack(buffer=buffer, ctx=self_ctx, name=steps)
+                continue
+            raw = buffer.read(compiled.size)
+            if len(raw) < compiled.size:
+                raise EndOfBufferException()
+            values = compiled.unpack(raw)
+            for (field_name, index, convert, validated_field, _) in steps:
+                value = values[index] if convert is None else convert(values, index, self_ctx, field_name)
+                if validated_field is not None:
+                    validated_field.validate_after_read(value, self_ctx, field_name)
+                res[field_name] = value
         return res
 
     def estimate_packed_size(self, data, ctx: WriteContext = None):
         self_ctx = WriteContext(data=data, block=self, parent=ctx)
         res = 0
         for name, field in self.field_blocks:
-            res += field.estimate_packed_size(data=data.get(name), ctx=self_ctx)
+            res += self_ctx.get_packed_size(field, data.get(name))
         return res
 
     def offset_to_child_when_packed(self, data, child_name: str, ctx: WriteContext = None):
@@ -97,20 +162,29 @@ class CompoundBlock(DataBlockWithChildren, DataBlock, ABC):
         for name, field in self.field_blocks:
             if name == child_name:
                 return res
-            res += field.estimate_packed_size(data=data.get(name), ctx=self_ctx)
+            res += self_ctx.get_packed_size(field, data.get(name))
         raise DataIntegrityException(f'Cannot calculate offset to child "{child_name}". Child with such name not found')
 
-    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
-        self_ctx = WriteContext(data=data, name=name, block=self, parent=ctx)
-        self_ctx.result = bytes()
+    def _write_fields_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        self_ctx = WriteContext(buffer=buffer, data=data, name=name, block=self, parent=ctx)
         for name, field in self.field_blocks:
             programmatic_value_func = self.field_extras_map.get(name, {}).get('programmatic_value')
             if programmatic_value_func is not None:
                 val = programmatic_value_func(self_ctx)
             else:
                 val = data[name]
-            self_ctx.result += field.pack(data=val, ctx=self_ctx, name=name)
-        return self_ctx.result
+            field.write_into(buffer, val, ctx=self_ctx, name=name)
+
+    def write_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        if type(self).write is not CompoundBlock.write:
+            # custom write logic
+            return super().write_into(buffer, data, ctx, name)
+        self._write_fields_into(buffer, data, ctx, name)
+
+    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
+        buffer = bytearray()
+        self._write_fields_into(buffer, data, ctx, name)
+        return bytes(buffer)
 
 
 class CompoundBlockFields(ABC):
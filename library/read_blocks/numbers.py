@@ -6,6 +6,10 @@ from library.exceptions import EndOfBufferException, DataIntegrityException
 from library.read_blocks.basic import DataBlock
 
 
+# struct format characters of signed integers with standard size by length in bytes
+_STRUCT_INTEGER_CHARS = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
+
 class IntegerBlock(DataBlock):
 
     def __init__(self, length, is_signed: bool = False, byte_order: Literal["little", "big"] = "little", **kwargs):
@@ -43,12 +47,35 @@ class IntegerBlock(DataBlock):
             return self.required_value
         return 0
 
+    # transforms integer, read from the buffer, to block data. Blocks, which represent numbers as something else,
+    # should override this method instead of read, so they can be used in struct-based fast paths
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return raw
+
     def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
              read_bytes_amount=None):
         raw = buffer.read(self.length)
         if len(raw) < self.length:
             raise EndOfBufferException()
-        return int.from_bytes(raw, byteorder=self.byte_order, signed=self.is_signed)
+        return self.from_raw_value(int.from_bytes(raw, byteorder=self.byte_order, signed=self.is_signed), ctx, name)
+
+    def get_struct_read_plan(self):
+        if type(self).read is not IntegerBlock.read:
+            return None
+        from_raw_value = None if type(self).from_raw_value is IntegerBlock.from_raw_value else self.from_raw_value
+        struct_char = _STRUCT_INTEGER_CHARS.get(self.length)
+        if struct_char and (self.length == 1 or self.byte_order == 'little'):
+            fmt = struct_char if self.is_signed else struct_char.upper()
+            if from_raw_value is None:
+                return fmt, 1, None, False
+            return fmt, 1, lambda values, index, ctx, name: from_raw_value(values[index], ctx, name), False
+        # struct module does not support 3-bytes numbers and mixing byte order in single format
+        from_raw_value = from_raw_value or (lambda raw, ctx, name: raw)
+        byte_order, is_signed = self.byte_order, self.is_signed
+        return (f'{self.length}s', 1,
+                lambda values, index, ctx, name: from_raw_value(int.from_bytes(values[index], byteorder=byte_order,
+                                                                               signed=is_signed), ctx, name),
+                False)
 
     def estimate_packed_size(self, data, ctx: WriteContext = None):
         return self.length
@@ -76,12 +103,10 @@ class BitFlagsBlock(IntegerBlock):
     def new_data(self):
         return [False] * 8
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        value = super().read(buffer, ctx, name, read_bytes_amount)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
         res = {}
         for i in range(8):
-            res[self.flag_name_map[i]] = bool(value & (1 if i == 0 else 1 << i))
+            res[self.flag_name_map[i]] = bool(raw & (1 if i == 0 else 1 << i))
         return res
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
@@ -116,9 +141,15 @@ class EnumByteBlock(IntegerBlock):
             return self.required_value
         return next(x for x in self.enum_name_map if x is not None)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        raw = super().read(buffer, ctx, name, read_bytes_amount)
+    def get_struct_read_plan(self):
+        plan = super().get_struct_read_plan()
+        if plan is None:
+            return None
+        # error message on unknown value contains context path
+        (fmt, values_count, convert, _) = plan
+        return fmt, values_count, convert, self.raise_error_on_unknown
+
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
         if self.raise_error_on_unknown and self.enum_name_map[raw] is None:
             raise DataIntegrityException(f'Unknown enum value {raw} at {ctx.ctx_path}/{name}')
         return self.enum_name_map[raw]
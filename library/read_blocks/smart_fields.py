@@ -85,12 +85,21 @@ class DelegateBlock(DataBlock):
 
     def estimate_packed_size(self, data, ctx: WriteContext = None):
         delegated_block, data = self.possible_blocks[data['choice_index']], data['data']
-        return delegated_block.estimate_packed_size(data, ctx=ctx)
+        if ctx is None:
+            return delegated_block.estimate_packed_size(data, ctx=ctx)
+        return ctx.get_packed_size(delegated_block, data)
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         delegated_block, data = self.possible_blocks[data['choice_index']], data['data']
         return delegated_block.write(data, ctx=ctx, name=name)
 
+    def write_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        if type(self).write is not DelegateBlock.write:
+            # custom write logic
+            return super().write_into(buffer, data, ctx, name)
+        delegated_block, data = self.possible_blocks[data['choice_index']], data['data']
+        delegated_block.write_into(buffer, data, ctx=ctx, name=name)
+
     def validate_after_read(self, value, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
         delegated_block, data = self.possible_blocks[value['choice_index']], value['data']
         return delegated_block.validate_after_read(data, ctx=ctx, name=name)
@@ -3,7 +3,7 @@ from typing import Dict
 
 from library.context import ReadContext, WriteContext
 from library.exceptions import EndOfBufferException
-from library.read_blocks.basic import DataBlock
+from library.read_blocks.basic import DataBlock, get_static_length, resolve_declared_length
 
 
 class UTF8Block(DataBlock):
@@ -34,46 +34,40 @@ class UTF8Block(DataBlock):
         return str(self._length)
 
     def resolve_length(self, ctx):
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
-            self_len = self_len(ctx)
-        return self_len
-
-    def _get_static_length(self):
-        self_len = self._length
-        if isinstance(self_len, tuple):
-            # cut off the documentation
-            (self_len, _) = self_len
-        if callable(self_len):
-            return None
-        return self_len
+        return resolve_declared_length(self._length, ctx)
 
     def new_data(self):
         if self.required_value:
             return self.required_value
         return ""
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        self_len = self.resolve_length(ctx)
-        res = buffer.read(self_len).decode('utf-8')
+    def _decode(self, raw: bytes, self_len: int):
+        res = raw.decode('utf-8')
         if len(res) < self_len:
             raise EndOfBufferException()
         if self._length == self_len:
             res = res.rstrip('\x00')
         return res
 
+    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
+             read_bytes_amount=None):
+        self_len = self.resolve_length(ctx)
+        return self._decode(buffer.read(self_len), self_len)
+
+    def get_struct_read_plan(self):
+        self_len = get_static_length(self._length)
+        if type(self).read is not UTF8Block.read or self_len is None:
+            return None
+        return f'{self_len}s', 1, lambda values, index, ctx, name: self._decode(values[index], self_len), False
+
     def estimate_packed_size(self, data, ctx: WriteContext = None):
-        static_length = self._get_static_length()
+        static_length = get_static_length(self._length)
         if static_length is not None:
             return max(len(data), static_length)
         return len(data)
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
-        static_length = self._get_static_length()
+        static_length = get_static_length(self._length)
         if static_length is not None and len(data) < static_length:
             data += '\x00' * (static_length - len(data))
         return data.encode('utf-8')
@@ -2,6 +2,7 @@ import os
 import tempfile
 
 import settings
+from library.utils.profiling import external_tool_timer
 
 
 def get_log_throwaway_suffix():
@@ -35,5 +36,6 @@ os.chdir("{working_dir}")
     command = f'"{settings.blender_executable}" --python {script_file.name} --background'
     if not settings.print_blender_log:
         command += get_log_throwaway_suffix()
-    os.system(command)
+    with external_tool_timer():
+        os.system(command)
     os.unlink(script_file.name)
@@ -1,4 +1,6 @@
-from io import BufferedReader, BytesIO
+import mmap
+from copy import deepcopy
+from io import BufferedReader, BytesIO, SEEK_SET, SEEK_CUR, SEEK_END
 from typing import Literal
 
 
@@ -18,3 +20,151 @@ def read_short(buffer: [BufferedReader, BytesIO], byteorder: Literal["little", "
 
 def read_byte(buffer: [BufferedReader, BytesIO]) -> int:
     return int.from_bytes(buffer.read(1), byteorder='little')
+
+
+# reads bytes without copying them, if buffer supports it (see MemoryViewReader)
+def read_view(buffer: [BufferedReader, BytesIO, "MemoryViewReader"], size: int):
+    reader = getattr(buffer, 'read_view', None)
+    return buffer.read(size) if reader is None else reader(size)
+
+
+# replaces memoryview-s in unpacked data with bytes. Should be called before the file, which data was read from with
+# MmapFileReader, gets overwritten
+def materialize_views(data):
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            keys = item.keys()
+        elif isinstance(item, list):
+            keys = range(len(item))
+        else:
+            continue
+        for key in keys:
+            value = item[key]
+            if isinstance(value, memoryview):
+                item[key] = value.tobytes()
+            else:
+                stack.append(value)
+
+
+# deep copy of unpacked data. memoryview-s cannot be copied by deepcopy, they are copied as bytes
+def copy_data(data):
+    memo = {}
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, memoryview):
+            memo[id(item)] = item.tobytes()
+    return deepcopy(data, memo)
+
+
+# read-only buffer over bytes-like object. Method read_view returns memoryview slices instead of copying data
+class MemoryViewReader:
+
+    def __init__(self, data, name: str = None):
+        self.name = name
+        self.view = memoryview(data)
+        self.position = 0
+
+    def read_view(self, size: int = -1) -> memoryview:
+        start = self.position
+        end = len(self.view) if size is None or size < 0 else min(start + size, len(self.view))
+        self.position = max(start, end)
+        return self.view[start:end]
+
+    def read(self, size: int = -1) -> bytes:
+        return self.read_view(size).tobytes()
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        if whence == SEEK_CUR:
+            offset += self.position
+        elif whence == SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError(f'Negative seek position {offset}')
+        self.position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self):
+        self.view = memoryview(b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# read-only file buffer over memory-mapped file. Mapped memory is released when file is closed and all views are
+# garbage-collected
+class MmapFileReader(MemoryViewReader):
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file cannot be mapped
+                mapped = b''
+        super().__init__(mapped, name=path)
+
+
+# output buffer of DataBlock.pack_into. Works like bytearray, but written data is flushed to the stream by chunks, so
+# packed file is not kept in memory entirely. Already flushed data still can be read back or patched in place (if
+# stream is readable and seekable)
+class StreamWriteBuffer:
+
+    def __init__(self, stream, chunk_size: int = 1024 * 1024):
+        self.stream = stream
+        self.stream_start = stream.tell()
+        self.chunk_size = chunk_size
+        self.flushed = 0
+        self.tail = bytearray()
+
+    def __len__(self):
+        return self.flushed + len(self.tail)
+
+    def __iadd__(self, data):
+        self.tail += data
+        if len(self.tail) >= self.chunk_size:
+            self.flush()
+        return self
+
+    def flush(self):
+        if self.tail:
+            self.stream.write(self.tail)
+            self.flushed += len(self.tail)
+            self.tail = bytearray()
+
+    def __getitem__(self, key: slice) -> bytes:
+        (start, stop, _) = key.indices(len(self))
+        stop = max(start, stop)
+        res = b''
+        if start < self.flushed:
+            self.stream.seek(self.stream_start + start)
+            res = self.stream.read(min(stop, self.flushed) - start)
+            self.stream.seek(self.stream_start + self.flushed)
+        return res + bytes(self.tail[max(start - self.flushed, 0):max(stop - self.flushed, 0)])
+
+    # patches already written bytes, size of the data cannot be changed
+    def __setitem__(self, key: slice, data):
+        (start, stop, _) = key.indices(len(self))
+        if stop - start != len(data):
+            raise ValueError('Cannot change size of already written data')
+        data = memoryview(data)
+        if start < self.flushed:
+            flushed_part = data[:self.flushed - start]
+            self.stream.seek(self.stream_start + start)
+            self.stream.write(flushed_part)
+            self.stream.seek(self.stream_start + self.flushed)
+            data = data[len(flushed_part):]
+            start += len(flushed_part)
+        self.tail[start - self.flushed:start - self.flushed + len(data)] = data
@@ -38,7 +38,7 @@ class ClassDict(dict):
         for key, value in self.items():
             if isinstance(value, ClassDict):
                 res[key] = value.to_dict()
-            elif isinstance(value, bytes):
+            elif isinstance(value, (bytes, memoryview)):
                 res[key] = list(value)
             elif isinstance(value, list):
                 res[key] = [x.to_dict()
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import shutil
 import subprocess
@@ -23,3 +24,43 @@ def remove_file_or_directory(path):
     except Exception as e:
         print(f"An error occurred while removing '{path}': {str(e)}")
         pass
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# copies file or directory tree. With hardlink=True creates hard links to files instead of copying them, if file
+# system supports it
+def copy_file_or_directory(src: str, dst: str, hardlink=False):
+    def copy_function(src_file, dst_file):
+        if hardlink:
+            try:
+                os.link(src_file, dst_file)
+                return dst_file
+            except OSError:
+                pass
+        return shutil.copy2(src_file, dst_file)
+
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=copy_function, dirs_exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        copy_function(src, dst)
+
+
+# packs data to the file by chunks (see DataBlock.pack_into). Output is written to temporary file first: it may be the
+# same file, which data was read from
+def pack_to_file(block, data, path: str):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w+b') as f:
+            block.pack_into(f, data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
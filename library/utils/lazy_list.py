@@ -0,0 +1,73 @@
+_NOT_LOADED = object()
+
+
+# list, which items are loaded with load_item(index) function on first access. Operations, which shift items or need
+# all of them, load all items first. Copying/pickling produces regular list
+class LazyList(list):
+
+    def __init__(self, length: int, load_item):
+        super().__init__([_NOT_LOADED] * length)
+        self.load_item = load_item
+
+    def is_loaded(self, index: int) -> bool:
+        return list.__getitem__(self, index) is not _NOT_LOADED
+
+    def loaded_items(self) -> list:
+        return [x for x in list.__iter__(self) if x is not _NOT_LOADED]
+
+    def _load(self, index: int):
+        value = list.__getitem__(self, index)
+        if value is _NOT_LOADED:
+            value = self.load_item(index)
+            list.__setitem__(self, index, value)
+        return value
+
+    def load_all(self):
+        for i in range(len(self)):
+            self._load(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._load(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('list index out of range')
+        return self._load(index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.load_all()
+        super().__setitem__(index, value)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._load(i)
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self._load(i)
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+    def __repr__(self):
+        self.load_all()
+        return super().__repr__()
+
+
+def _load_all_before(method_name):
+    method = getattr(list, method_name)
+
+    def wrapper(self, *args, **kwargs):
+        self.load_all()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method_name
+    return wrapper
+
+
+for _method_name in ['__contains__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__', '__add__', '__mul__',
+                     '__rmul__', '__imul__', '__delitem__', 'copy', 'count', 'index', 'insert', 'pop', 'remove',
+                     'reverse', 'sort']:
+    setattr(LazyList, _method_name, _load_all_before(_method_name))
@@ -0,0 +1,36 @@
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# seconds, spent by current process waiting for external tools (blender, ffmpeg)
+_external_tools_time = 0.0
+
+
+# wrap calls of external tools with it, so the time is reported in conversion report
+@contextmanager
+def external_tool_timer():
+    global _external_tools_time
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _external_tools_time += time.perf_counter() - start_time
+
+
+def get_external_tools_time() -> float:
+    return _external_tools_time
+
+
+# peak resident set size of current process in bytes. None if platform does not provide it
+def get_peak_rss():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere except macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
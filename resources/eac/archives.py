@@ -1,9 +1,11 @@
 from abc import abstractmethod, ABC
-from copy import deepcopy
+from bisect import bisect_right
 from io import BufferedReader, BytesIO
 from typing import Dict
 
+import settings
 from library.context import ReadContext, WriteContext
+from library.exceptions import EndOfBufferException, DataIntegrityException, BlockDefinitionException
 from library.read_blocks import (CompoundBlock,
                                  DeclarativeCompoundBlock,
                                  UTF8Block,
@@ -13,6 +15,8 @@ from library.read_blocks import (CompoundBlock,
                                  BytesBlock,
                                  DataBlock)
 from library.read_blocks.strings import NullTerminatedUTF8Block
+from library.utils.buffer_utils import read_view, MemoryViewReader, copy_data
+from library.utils.lazy_list import LazyList
 from resources.eac.audios import EacsAudioFile, SoundBankHeaderEntry
 from resources.eac.bitmaps import Bitmap8Bit, Bitmap4Bit, Bitmap16Bit0565, Bitmap32Bit, Bitmap16Bit1555, Bitmap24Bit
 from resources.eac.car_specs import CarSimplifiedPerformanceSpec, CarPerformanceSpec
@@ -37,6 +41,8 @@ class CompressedBlock(AutoDetectBlock):
                                           CarPerformanceSpec()],
                          **kwargs)
         self.algorithm = None
+        # compression function. If not set, block is written uncompressed
+        self.compress_algorithm = None
 
     def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
              read_bytes_amount=None):
@@ -46,12 +52,25 @@ class CompressedBlock(AutoDetectBlock):
                                read_bytes_amount=len(uncompressed_bytes))
         return super().read(buffer=uncompressed, ctx=self_ctx, read_bytes_amount=len(uncompressed_bytes))
 
+    def estimate_packed_size(self, data, ctx: WriteContext = None):
+        if self.compress_algorithm is None:
+            return super().estimate_packed_size(data, ctx)
+        return len(self.write(data, ctx))
+
+    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
+        uncompressed = super().write(data, ctx=ctx, name=name)
+        if self.compress_algorithm is None:
+            return uncompressed
+        return self.compress_algorithm(BytesIO(uncompressed), len(uncompressed))
+
 
 class RefPackBlock(CompressedBlock):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.algorithm = RefPackCompression().uncompress
+        compression = RefPackCompression()
+        self.algorithm = compression.uncompress
+        self.compress_algorithm = compression.compress
 
 
 class Qfs2Block(CompressedBlock):
@@ -68,6 +87,63 @@ class Qfs3Block(CompressedBlock):
         self.algorithm = Qfs3Compression().uncompress
 
 
+# length of archive item without known length: up to the next item offset (relative to archive start) or up to the
+# archive end. Sorted offsets are computed once per archive read
+def length_up_to_next_item(ctx: ReadContext, get_offsets) -> int:
+    sorted_offsets = ctx.get_cached('sorted_item_offsets', lambda: sorted(get_offsets()))
+    position = ctx.buffer.tell() - ctx.read_start_offset
+    index = bisect_right(sorted_offsets, position)
+    if index < len(sorted_offsets):
+        return sorted_offsets[index] - position
+    if ctx.read_bytes_amount is not None and ctx.read_bytes_amount > position:
+        return ctx.read_bytes_amount - position
+    raise DataIntegrityException(f'Cannot find the end of archive item at {ctx.ctx_path}')
+
+
+# children of archive block, which are parsed on first access (see settings.lazy_archive_children). Keeps raw bytes of
+# the archive: not accessed children are written as is
+class LazyArchiveChildren(LazyList):
+
+    def __init__(self, block: 'BaseArchiveBlock', ctx: ReadContext, archive, slots):
+        super().__init__(len(slots), self._load_child)
+        self.block = block
+        self.archive = archive
+        # list of (alias, offset in archive, length) or None for recursive reference
+        self.slots = slots
+        # bytes of the child slot, which were not consumed by child block
+        self.trailing_payloads = {}
+        self.name = ctx.name
+        self.parent_path = ctx.parent.ctx_path if ctx.parent else ''
+        self.archive_data = ctx.get_full_data()
+        # blocks may detect data by file name
+        self.buffer_name = getattr(ctx.buffer, 'name', None)
+        self.archive_ctx = None
+
+    def raw_child(self, index: int):
+        (_, offset, length) = self.slots[index]
+        return self.archive[offset:offset + length]
+
+    def _load_child(self, index: int):
+        slot = self.slots[index]
+        if slot is None:
+            return None
+        (alias, offset, length) = slot
+        if self.archive_ctx is None:
+            # archive is read from its own buffer, so context is detached from the original (already closed) one
+            self.archive_ctx = ReadContext(buffer=MemoryViewReader(self.archive, name=self.buffer_name),
+                                           name=self.name,
+                                           data=self.archive_data, block=self.block,
+                                           parent=ReadContext(name=self.parent_path),
+                                           read_bytes_amount=len(self.archive))
+        buffer = self.archive_ctx.buffer
+        buffer.seek(offset)
+        child = self.block.field_blocks_map['children'].child.unpack(buffer, ctx=self.archive_ctx, name=alias,
+                                                                     read_bytes_amount=length)
+        if buffer.tell() < offset + length:
+            self.trailing_payloads[index] = self.archive[buffer.tell():offset + length]
+        return child
+
+
 ### A block, which contains multiple data blocks, consist of header with item descriptions and
 ### separate space when items themselves located.
 ###
@@ -80,12 +156,48 @@ class Qfs3Block(CompressedBlock):
 ### Aliases can repeat
 class BaseArchiveBlock(DeclarativeCompoundBlock, ABC):
 
+    # archives, which know lengths of all children, can parse them lazily (see settings.lazy_archive_children)
+    supports_lazy_children = False
+
+    # first pass of writing: computes layout of packed archive from sizes of children, so header and children can be
+    # written right away, in one pass. If children sizes are provided, they are used instead of estimations.
+    # Returns dict with generated items descriptions, list of (alias, offset in heap, length) for children, header
+    # size and total length of packed archive
+    def plan_layout(self, data, ctx: WriteContext = None, children_sizes=None):
+        if ctx is None:
+            ctx = WriteContext(block=self)
+        child_block = self.field_blocks_map['children'].child
+        children_data = data['children']
+        offset_payloads = data['offset_payloads']
+        is_lazy = isinstance(children_data, LazyArchiveChildren)
+        children = []
+        heap_size = 0
+        for i in range(len(children_data)):
+            heap_size += len(offset_payloads[i])
+            if children_sizes is not None:
+                length = children_sizes[i]
+            elif is_lazy and not children_data.is_loaded(i):
+                # do not parse children only for estimating size
+                length = len(children_data.raw_child(i))
+            else:
+                length = ctx.get_packed_size(child_block, children_data[i])
+            children.append((data['children_aliases'][i], heap_size, length))
+            heap_size += length
+            if is_lazy:
+                heap_size += len(children_data.trailing_payloads.get(i, b''))
+        for i in range(len(children_data), len(offset_payloads)):
+            heap_size += len(offset_payloads[i])
+        items_descr = self.generate_items_descr(data, children)
+        header_size = self.offset_to_child_when_packed({**data, 'items_descr': items_descr}, 'children', ctx)
+        return {
+            'items_descr': items_descr,
+            'children': children,
+            'header_size': header_size,
+            'length': header_size + heap_size,
+        }
+
     def estimate_packed_size(self, data, ctx: WriteContext = None):
-        offsets_sum = 0
-        # CompoundBlock does not know about payloads between items
-        for offset in data['offset_payloads']:
-            offsets_sum += len(offset)
-        return super().estimate_packed_size(data, ctx) + offsets_sum
+        return self.plan_layout(data, ctx)['length']
 
     def new_data(self):
         # CompoundBlock does not create those custom fields
@@ -106,7 +218,7 @@ class BaseArchiveBlock(DeclarativeCompoundBlock, ABC):
     def handle_archive_child(self, buffer, abs_offsets, i, self_ctx):
         (alias, offset, length) = abs_offsets[i]
         if offset > buffer.tell():
-            offset_payload = buffer.read(offset - buffer.tell())
+            offset_payload = read_view(buffer, offset - buffer.tell())
         else:
             offset_payload = b''
             buffer.seek(offset)
@@ -118,8 +230,11 @@ class BaseArchiveBlock(DeclarativeCompoundBlock, ABC):
              read_bytes_amount=None):
         block_start = buffer.tell()
         res = super().read(buffer, ctx, name, read_bytes_amount)
-        self_ctx = next(c for c in ctx.children if c.name == name)
+        self_ctx = next(c for c in reversed(ctx.children) if c.name == name)
         abs_offsets = self.parse_abs_offsets(block_start, res, read_bytes_amount)
+        if (self.supports_lazy_children and settings.lazy_archive_children and read_bytes_amount is not None
+                and all(length is not None for (_, _, length) in abs_offsets)):
+            return self.read_lazy(buffer, block_start, read_bytes_amount, res, self_ctx, abs_offsets)
         children = []
         aliases = []
         offset_payloads = []
@@ -136,7 +251,7 @@ class BaseArchiveBlock(DeclarativeCompoundBlock, ABC):
             children.extend(c)
         if res.get('length') is not None and buffer.tell() < block_start + res['length']:
             diff = block_start + res['length'] - buffer.tell()
-            offset_payloads.append(buffer.read(diff))
+            offset_payloads.append(read_view(buffer, diff))
         if read_bytes_amount is not None:
             buffer.seek(block_start + read_bytes_amount)
         res['children'] = children
@@ -144,30 +259,96 @@ class BaseArchiveBlock(DeclarativeCompoundBlock, ABC):
         res['offset_payloads'] = offset_payloads
         return res
 
-    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
-        children_heap = b''
-        children = []
-        child_block = self.field_blocks_map['children'].child
-        for i, item in enumerate(data['children']):
-            children_heap += data['offset_payloads'][i]
-            item_data = child_block.pack(data=item, ctx=ctx, name=str(i))
-            children.append((data['children_aliases'][i], len(children_heap), len(item_data)))
-            children_heap += item_data
-        if len(data['offset_payloads']) > len(data['children']):
-            for i in range(len(data['children']), len(data['offset_payloads'])):
-                children_heap += data['offset_payloads'][i]
-        data['items_descr'] = self.generate_items_descr(data, children)
-        self_ctx = WriteContext(data=data, name=name, block=self, parent=ctx)
-        res = bytes()
+    # reads only the archive header, children are parsed on first access
+    def read_lazy(self, buffer, block_start, read_bytes_amount, res, self_ctx, abs_offsets):
+        position = buffer.tell() - block_start
+        buffer.seek(block_start)
+        archive = read_view(buffer, read_bytes_amount)
+        if len(archive) < read_bytes_amount:
+            raise EndOfBufferException()
+        slots = []
+        aliases = []
+        offset_payloads = []
+        for (alias, offset, length) in abs_offsets:
+            offset -= block_start
+            # recursive reference, happens in wwww blocks
+            if offset == 0:
+                offset_payloads.append(b'')
+                aliases.append(None)
+                slots.append(None)
+                continue
+            offset_payloads.append(archive[position:offset] if offset > position else b'')
+            aliases.append(alias)
+            slots.append((alias, offset, length))
+            position = offset + length
+        if res.get('length') is not None and position < res['length']:
+            offset_payloads.append(archive[position:res['length']])
+        res['children'] = LazyArchiveChildren(self, self_ctx, archive, slots)
+        res['children_aliases'] = aliases
+        res['offset_payloads'] = offset_payloads
+        return res
+
+    def _write_header_into(self, buffer: bytearray, data, self_ctx: WriteContext, layout):
+        data['items_descr'] = layout['items_descr']
+        # archive length, asked by programmatic values, is already known
+        self_ctx.set_packed_size(self, data, layout['length'])
         for name, field in (x for x in self.field_blocks if x[0] != 'children'):
             programmatic_value_func = self.field_extras_map.get(name, {}).get('programmatic_value')
             if programmatic_value_func is not None:
                 val = programmatic_value_func(self_ctx)
             else:
                 val = data[name]
-            res += field.pack(data=val, ctx=self_ctx, name=name)
-        res += children_heap
-        return res
+            field.write_into(buffer, val, ctx=self_ctx, name=name)
+
+    # second pass of writing: streams header and children to the buffer. If some child cannot estimate own size
+    # properly, header is patched after writing children
+    def _write_archive_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        # children are written with archive context, so all estimations during the write share sizes cache
+        self_ctx = WriteContext(buffer=buffer, data=data, name=name, block=self, parent=ctx)
+        child_block = self.field_blocks_map['children'].child
+        children_data = data['children']
+        is_lazy = isinstance(children_data, LazyArchiveChildren)
+        try:
+            layout = self.plan_layout(data, self_ctx)
+        except BlockDefinitionException:
+            layout = self.plan_layout(data, self_ctx, [0] * len(children_data))
+        header_start = len(buffer)
+        self._write_header_into(buffer, data, self_ctx, layout)
+        if len(buffer) - header_start != layout['header_size']:
+            raise DataIntegrityException(f'Packed header size of {self_ctx.ctx_path} does not match estimated size')
+        children_sizes = []
+        for i in range(len(children_data)):
+            buffer += data['offset_payloads'][i]
+            item_start = len(buffer)
+            if is_lazy and not children_data.is_loaded(i):
+                buffer += children_data.raw_child(i)
+            else:
+                child_block.write_into(buffer, children_data[i], ctx=self_ctx, name=str(i))
+            children_sizes.append(len(buffer) - item_start)
+            if is_lazy:
+                buffer += children_data.trailing_payloads.get(i, b'')
+        for i in range(len(children_data), len(data['offset_payloads'])):
+            buffer += data['offset_payloads'][i]
+        if children_sizes != [length for (_, _, length) in layout['children']]:
+            # header has the same size, only offsets and lengths in it change
+            layout = self.plan_layout(data, self_ctx, children_sizes)
+            header = bytearray()
+            self._write_header_into(header, data, WriteContext(buffer=header, data=data, name=name, block=self,
+                                                               parent=ctx), layout)
+            if len(header) != layout['header_size'] or header_start + layout['length'] != len(buffer):
+                raise DataIntegrityException(f'Cannot patch header of {self_ctx.ctx_path}')
+            buffer[header_start:header_start + len(header)] = header
+
+    def write_into(self, buffer: bytearray, data, ctx: WriteContext = None, name: str = ''):
+        if type(self).write is not BaseArchiveBlock.write:
+            # custom write logic
+            return super().write_into(buffer, data, ctx, name)
+        self._write_archive_into(buffer, data, ctx, name)
+
+    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
+        buffer = bytearray()
+        self._write_archive_into(buffer, data, ctx, name)
+        return bytes(buffer)
 
 
 class ShpiBlock(BaseArchiveBlock):
@@ -185,7 +366,7 @@ class ShpiBlock(BaseArchiveBlock):
                        {'description': 'Resource ID'})
         length = (IntegerBlock(length=4),
                   {'description': 'The length of this SHPI block in bytes',
-                   'programmatic_value': lambda ctx: ctx.block.estimate_packed_size(ctx.get_full_data())})
+                   'programmatic_value': lambda ctx: ctx.get_packed_size(ctx.block, ctx.get_full_data())})
         num_items = (IntegerBlock(length=4),
                      {'description': 'An amount of items',
                       'programmatic_value': lambda ctx: len(ctx.data('items_descr'))})
@@ -215,11 +396,9 @@ class ShpiBlock(BaseArchiveBlock):
                                    Palette24Bit(),
                                    Palette32Bit(),
                                    ShpiText(),
-                                   BytesBlock(length=(lambda ctx: next(x for x in (
-                                       x['offset'] + ctx.read_start_offset - ctx.buffer.tell()
-                                       for x in (sorted(ctx.data('items_descr'), key=lambda x: x['offset'])
-                                                 + [{'offset': ctx.read_bytes_amount}])
-                                   ) if x > 0), 'item_length'))])),
+                                   BytesBlock(length=(lambda ctx: length_up_to_next_item(
+                                       ctx, lambda: [x['offset'] for x in ctx.data('items_descr')]),
+                                                      'item_length'))])),
                     {'description': 'A part of block, where items data is located. Offsets to some of the entries are '
                                     'defined in `items_descr` block. Between them there can be non-indexed '
                                     'entries (palettes and texts)'})
@@ -259,6 +438,7 @@ class ShpiBlock(BaseArchiveBlock):
 
 
 class WwwwBlock(BaseArchiveBlock):
+    supports_lazy_children = True
 
     @property
     def schema(self) -> Dict:
@@ -301,19 +481,19 @@ class WwwwBlock(BaseArchiveBlock):
             ShpiBlock(),
             OripGeometry(),
             self,
-            BytesBlock(length=(lambda ctx: next(x for x in (
-                x + ctx.read_start_offset - ctx.buffer.tell()
-                for x in (sorted(ctx.data('items_descr')) + [ctx.read_bytes_amount])
-            ) if x > 0), 'item_length'))])
+            BytesBlock(length=(lambda ctx: length_up_to_next_item(ctx, lambda: ctx.data('items_descr')),
+                               'item_length'))])
         self.field_blocks_map['children'].child = self.child_block
 
     def parse_abs_offsets(self, block_start, data, read_bytes_amount):
         offsets = [block_start + x for x in data['items_descr']]
+        sorted_offsets = sorted(offsets)
         lengths = []
         for offset in offsets:
-            try:
-                lengths.append(sorted(x for x in offsets if x > offset)[0] - offset)
-            except IndexError:
+            index = bisect_right(sorted_offsets, offset)
+            if index < len(sorted_offsets):
+                lengths.append(sorted_offsets[index] - offset)
+            else:
                 lengths.append(block_start + read_bytes_amount - offset)
         return [(str(i), o, l) for i, (o, l) in enumerate(zip(offsets, lengths))]
 
@@ -324,6 +504,7 @@ class WwwwBlock(BaseArchiveBlock):
 
 
 class BigfBlock(BaseArchiveBlock):
+    supports_lazy_children = True
 
     @property
     def schema(self) -> Dict:
@@ -349,7 +530,7 @@ class BigfBlock(BaseArchiveBlock):
                        {'description': 'Resource ID'})
         length = (IntegerBlock(length=4, byte_order='big'),
                   {'description': 'The length of this BIGF block in bytes',
-                   'programmatic_value': lambda ctx: ctx.block.estimate_packed_size(ctx.get_full_data())})
+                   'programmatic_value': lambda ctx: ctx.get_packed_size(ctx.block, ctx.get_full_data())})
         num_items = (IntegerBlock(length=4, byte_order='big'),
                      {'description': 'An amount of items',
                       'programmatic_value': lambda ctx: len(ctx.data('items_descr'))})
@@ -371,8 +552,9 @@ class BigfBlock(BaseArchiveBlock):
             self,
             BytesBlock(
                 length=(lambda ctx:
-                        next(x for x in ctx.data('items_descr')
-                             if x['offset'] == ctx.buffer.tell() - ctx.read_start_offset)['length'],
+                        ctx.get_cached('item_lengths', lambda: {x['offset']: x['length']
+                                                                for x in reversed(ctx.data('items_descr'))})[
+                            ctx.buffer.tell() - ctx.read_start_offset],
                         'item_length'))])
         self.field_blocks_map['children'].child = child_block
 
@@ -444,7 +626,7 @@ class SoundBank(DeclarativeCompoundBlock):
         return res
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
-        wave_data_heap = b''
+        wave_data_heap = bytearray()
         wave_data_offset = self.offset_to_child_when_packed(data, 'wave_data')
         wave_pointers = []
         for i, child in enumerate(data['children']):
@@ -457,7 +639,7 @@ class SoundBank(DeclarativeCompoundBlock):
         wave_data_heap += data['children_offsets'][-1]
         for i, item in enumerate(data['items']):
             item['eacs_header']['wave_data_offset'] = wave_pointers[i]
-        data_to_write = deepcopy(data)
+        data_to_write = copy_data(data)
         data_to_write['wave_data'] = wave_data_heap
         data_to_write['children'] = []
         return super().write(data_to_write, ctx, name)
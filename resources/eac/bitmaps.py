@@ -1,6 +1,11 @@
+from io import BufferedReader, BytesIO
 from typing import Dict
 
-from library.read_blocks import (DeclarativeCompoundBlock,
+import settings
+from library.context import ReadContext, WriteContext
+from library.exceptions import EndOfBufferException
+from library.read_blocks import (DataBlock,
+                                 DeclarativeCompoundBlock,
                                  IntegerBlock,
                                  SubByteArrayBlock,
                                  BytesBlock,
@@ -18,6 +23,27 @@ class AnyBitmapBlock(DeclarativeCompoundBlock):
     pass
 
 
+# array of bitmap pixel colors. If enabled in settings, it is unpacked to numpy RGBA uint8 array with shape
+# (width*height, 4) instead of list of RGBA integers, all pixels are decoded at once by child color block
+class BitmapPixelsBlock(ArrayBlock):
+
+    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
+             read_bytes_amount=None):
+        if not settings.images__unpack_to_numpy_arrays:
+            return super().read(buffer, ctx, name, read_bytes_amount)
+        self_len = self.resolve_length(ctx)
+        raw = buffer.read(self_len * self.child.length)
+        if len(raw) < self_len * self.child.length:
+            raise EndOfBufferException()
+        return self.child.unpack_rgba_array(raw)
+
+    def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
+        if not isinstance(data, list):
+            # numpy array => list of RGBA integers
+            data = data.view('>u4').ravel().tolist()
+        return super().write(data, ctx, name)
+
+
 class Bitmap16Bit0565(AnyBitmapBlock, DeclarativeCompoundBlock):
     class Fields(DeclarativeCompoundBlock.Fields):
         resource_id = (IntegerBlock(length=1, required_value=0x78),
@@ -34,7 +60,7 @@ class Bitmap16Bit0565(AnyBitmapBlock, DeclarativeCompoundBlock):
              {'description': 'X coordinate of bitmap position on screen. Used for menu/dash sprites'})
         y = (IntegerBlock(length=2),
              {'description': 'Y coordinate of bitmap position on screen. Used for menu/dash sprites'})
-        bitmap = (ArrayBlock(child=Color16Bit0565Block(simplified=True),
+        bitmap = (BitmapPixelsBlock(child=Color16Bit0565Block(simplified=True),
                              length=(lambda ctx: ctx.data('width') * ctx.data('height'), 'width*height')),
                   {'description': 'Colors of bitmap pixels'})
 
@@ -127,7 +153,7 @@ class Bitmap32Bit(AnyBitmapBlock, DeclarativeCompoundBlock):
              {'description': 'X coordinate of bitmap position on screen. Used for menu/dash sprites'})
         y = (IntegerBlock(length=2),
              {'description': 'Y coordinate of bitmap position on screen. Used for menu/dash sprites'})
-        bitmap = (ArrayBlock(child=Color32BitBlock(),
+        bitmap = (BitmapPixelsBlock(child=Color32BitBlock(),
                              length=(lambda ctx: ctx.data('width') * ctx.data('height'), 'width*height')),
                   {'description': 'Colors of bitmap pixels'})
 
@@ -148,7 +174,7 @@ class Bitmap16Bit1555(AnyBitmapBlock, DeclarativeCompoundBlock):
              {'description': 'X coordinate of bitmap position on screen. Used for menu/dash sprites'})
         y = (IntegerBlock(length=2),
              {'description': 'Y coordinate of bitmap position on screen. Used for menu/dash sprites'})
-        bitmap = (ArrayBlock(child=Color16Bit1555Block(),
+        bitmap = (BitmapPixelsBlock(child=Color16Bit1555Block(),
                              length=(lambda ctx: ctx.data('width') * ctx.data('height'), 'width*height')),
                   {'description': 'Colors of bitmap pixels'})
 
@@ -169,6 +195,6 @@ class Bitmap24Bit(AnyBitmapBlock, DeclarativeCompoundBlock):
              {'description': 'X coordinate of bitmap position on screen. Used for menu/dash sprites'})
         y = (IntegerBlock(length=2),
              {'description': 'Y coordinate of bitmap position on screen. Used for menu/dash sprites'})
-        bitmap = (ArrayBlock(child=Color24BitLittleEndianField(),
+        bitmap = (BitmapPixelsBlock(child=Color24BitLittleEndianField(),
                              length=(lambda ctx: ctx.data('width') * ctx.data('height'), 'width*height')),
                   {'description': 'Colors of bitmap pixels'})
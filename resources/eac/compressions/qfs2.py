@@ -1,45 +1,55 @@
-from io import BufferedReader, SEEK_CUR, BytesIO
+import re
+from io import BufferedReader, BytesIO
 
-from library.utils import read_byte, read_3int
 from resources.eac.compressions.base import BaseCompressionAlgorithm
 
 
 class Qfs2Compression(BaseCompressionAlgorithm):
 
-    def _read_value(self, buffer, patterns) -> bytes:
-        value = buffer.read(1)
-        if value in patterns.keys():
-            return patterns[value]
-        return value
-
     def uncompress(self, buffer: [BufferedReader, BytesIO], input_length: int):
-        uncompressed: bytearray = bytearray()
-        buffer.seek(2, SEEK_CUR)  # skip header
-        output_length = read_3int(buffer, byteorder='big')
-        value_indicator = read_byte(buffer)
-        patterns_count = read_byte(buffer)
-        bytes_used = 7
-        patterns = {}
-        for i in range(0, patterns_count):
-            pattern_id = buffer.read(1)
-            value1 = self._read_value(buffer, patterns)
-            value2 = self._read_value(buffer, patterns)
-            if pattern_id in patterns.keys():
+        data = buffer.read(input_length)
+        if len(data) < 7:
+            data = data.ljust(7, b'\0')
+        # skip header
+        output_length = int.from_bytes(data[2:5], byteorder='big')
+        value_indicator = data[5]
+        patterns_count = data[6]
+        body_start = 7 + 3 * patterns_count
+        if len(data) < body_start:
+            data += buffer.read(body_start - len(data))
+        data = memoryview(data)
+        # expansion table: for every byte the bytes, which it represents. Patterns may reference previously defined
+        # patterns, so they are expanded fully when defined
+        expansions = [bytes([i]) for i in range(256)]
+        pattern_ids = set()
+        for i in range(7, body_start, 3):
+            pattern_id, value1, value2 = data[i:i + 3].tobytes().ljust(3, b'\0')
+            if pattern_id in pattern_ids:
                 raise Exception('Duplicate id in QFS2 patterns')
-            patterns[pattern_id] = value1 + value2
-            bytes_used = bytes_used + 3
-        use_value = False
-        while bytes_used < input_length:
-            if use_value:
-                value = buffer.read(1)
-                use_value = False
-            else:
-                value = self._read_value(buffer, patterns)
-            if int.from_bytes(value, byteorder='little') == value_indicator:
-                use_value = True
-            else:
-                uncompressed.extend(value)
-            bytes_used = bytes_used + 1
+            pattern_ids.add(pattern_id)
+            expansions[pattern_id] = expansions[value1] + expansions[value2]
+        # bytes, which expand to value indicator. The next byte after them is not expanded
+        indicators = [i for i in range(256)
+                      if int.from_bytes(expansions[i], byteorder='little') == value_indicator]
+        body = data[body_start:max(input_length, body_start)]
+        uncompressed = bytearray()
+        expand = expansions.__getitem__
+        position = 0
+        if indicators:
+            indicator_regex = re.compile(b'[' + b''.join(re.escape(bytes([i])) for i in indicators) + b']')
+            while True:
+                match = indicator_regex.search(body, position)
+                if match is None:
+                    break
+                indicator_position = match.start()
+                uncompressed += b''.join(map(expand, body[position:indicator_position]))
+                # value after indicator is written as is, unless it is value indicator itself
+                value_position = indicator_position + 1
+                while value_position < len(body) and body[value_position] == value_indicator:
+                    value_position += 1
+                uncompressed += body[value_position:value_position + 1]
+                position = value_position + 1
+        uncompressed += b''.join(map(expand, body[position:]))
 
         if output_length > len(uncompressed):
             raise ValueError(
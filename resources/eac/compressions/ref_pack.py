@@ -1,6 +1,5 @@
-from io import BufferedReader, SEEK_CUR, BytesIO
+from io import BufferedReader, BytesIO
 
-from library.utils.buffer_utils import read_byte
 from resources.eac.compressions.base import BaseCompressionAlgorithm
 
 
@@ -8,6 +7,13 @@ from resources.eac.compressions.base import BaseCompressionAlgorithm
 # https://www.wiki.sc4devotion.com/index.php?title=DBPF_Compression
 class RefPackCompression(BaseCompressionAlgorithm):
 
+    # window_size: max back-reference offset, RefPack supports up to 131072 bytes.
+    # effort: amount of previous occurrences in hash chain, checked when looking for the longest match. Bigger effort
+    # gives better compression, but slower
+    def __init__(self, window_size: int = 0x20000, effort: int = 8):
+        self.window_size = min(window_size, 0x20000)
+        self.effort = max(effort, 1)
+
     def _parse_archive_flags(self, flags_byte):
         # specifies that the decompressed field and (if applicable) the compressed size field are 4-byte fields;
         # if this flag is unset, both of these fields are 3-byte fields.
@@ -15,70 +21,188 @@ class RefPackCompression(BaseCompressionAlgorithm):
         contains_compressed_size = bool(flags_byte & 0b0000_0001)
         return long_file, contains_compressed_size
 
-    def _copy_bytes_to_output(self, buffer, uncompressed: bytearray, length):
-        uncompressed.extend(buffer.read(length))
-
-    def _reuse_bytes_in_output(self, buffer, uncompressed: bytearray, length, offset):
-        if length > offset:
-            old_length = len(uncompressed)
-            while len(uncompressed) < old_length + length:
-                uncompressed.extend(uncompressed[-offset].to_bytes(1, byteorder='big'))
-        elif offset == length:
-            uncompressed.extend(uncompressed[-offset:])
-        elif length > 0:
-            uncompressed.extend(uncompressed[-offset:-offset + length])
+    # copies `length` bytes, located `offset` bytes before the end of output. If length is bigger than offset, the
+    # source overlaps with destination, so bytes are copied by chunks, doubling in size (source pattern repeats)
+    @staticmethod
+    def _reuse_bytes_in_output(uncompressed: bytearray, output_pos: int, length: int, offset: int) -> int:
+        src = output_pos - offset
+        if src < 0:
+            raise ValueError(f'Error while unpacking QFS archive: back-reference offset {offset} is out of output')
+        end = output_pos + length
+        while output_pos < end:
+            chunk = min(output_pos - src, end - output_pos)
+            uncompressed[output_pos:output_pos + chunk] = uncompressed[src:src + chunk]
+            output_pos += chunk
+        return output_pos
 
     def uncompress(self, buffer: [BufferedReader, BytesIO], input_length: int):
-        uncompressed: bytearray = bytearray()
-        use_4_bytes, contains_compressed_size = self._parse_archive_flags(read_byte(buffer))
-        buffer.seek(1, SEEK_CUR)  # skip RefPack indicator 0xfb
-        output_length = (read_byte(buffer) << 16) + (read_byte(buffer) << 8) + read_byte(buffer)
-        bytes_used = 5
-        if contains_compressed_size:
-            buffer.seek(3, SEEK_CUR)
-            bytes_used = 8
-        pack_code = read_byte(buffer)
-        bytes_used = bytes_used + 1
-        last_uncompressed_len = -1
-        while pack_code < 0xFC:
-            if last_uncompressed_len == len(uncompressed):
-                raise ValueError(f'Error while unpacking QFS archive: infinite loop detected')
-            last_uncompressed_len = len(uncompressed)
-            pack_a, pack_b = read_byte(buffer), read_byte(buffer)
-            bytes_used = bytes_used + 2
-            if not (pack_code & 0x80):
-                length = pack_code & 3
-                buffer.seek(-1, SEEK_CUR)
-                self._copy_bytes_to_output(buffer, uncompressed, length)
-                bytes_used = bytes_used + length - 1
-                offset = ((pack_code >> 5) << 8) + pack_a + 1
-                length = ((pack_code & 0x1c) >> 2) + 3
-                self._reuse_bytes_in_output(buffer, uncompressed, length, offset)
-            elif not pack_code & 0x40:
-                length = (pack_a >> 6) & 3
-                self._copy_bytes_to_output(buffer, uncompressed, length)
-                bytes_used = bytes_used + length
-                offset = (pack_a & 0x3f) * 256 + pack_b + 1
-                length = (pack_code & 0x3f) + 4
-                self._reuse_bytes_in_output(buffer, uncompressed, length, offset)
-            elif not pack_code & 0x20:
-                pack_c = read_byte(buffer)
-                length = pack_code & 3
-                self._copy_bytes_to_output(buffer, uncompressed, length)
-                bytes_used = bytes_used + length + 1
-                offset = ((pack_code & 0x10) << 12) + 256 * pack_a + pack_b + 1
-                length = ((pack_code >> 2) & 3) * 256 + pack_c + 5
-                self._reuse_bytes_in_output(buffer, uncompressed, length, offset)
-            else:
-                length = (pack_code & 0x1f) * 4 + 4
-                buffer.seek(-2, SEEK_CUR)
-                self._copy_bytes_to_output(buffer, uncompressed, length)
-                bytes_used = bytes_used + length - 2
-            pack_code = read_byte(buffer)
-            bytes_used = bytes_used + 1
-        if bytes_used < input_length and len(uncompressed) < output_length:
-            self._copy_bytes_to_output(buffer, uncompressed, input_length - bytes_used)
-        if output_length != len(uncompressed):
+        start_offset = buffer.tell()
+        data = memoryview(buffer.read(input_length))
+        data_length = len(data)
+        try:
+            use_4_bytes, contains_compressed_size = self._parse_archive_flags(data[0])
+            # data[1] is RefPack indicator 0xfb
+            output_length = (data[2] << 16) + (data[3] << 8) + data[4]
+            pos = 8 if contains_compressed_size else 5
+            uncompressed = bytearray(output_length)
+            output_pos = 0
+            pack_code = data[pos]
+            pos += 1
+            while pack_code < 0xFC:
+                pack_a = data[pos]
+                if not (pack_code & 0x80):
+                    length = pack_code & 3
+                    uncompressed[output_pos:output_pos + length] = data[pos + 1:pos + 1 + length]
+                    output_pos += length
+                    pos += 1 + length
+                    offset = ((pack_code >> 5) << 8) + pack_a + 1
+                    length = ((pack_code & 0x1c) >> 2) + 3
+                elif not pack_code & 0x40:
+                    pack_b = data[pos + 1]
+                    length = (pack_a >> 6) & 3
+                    uncompressed[output_pos:output_pos + length] = data[pos + 2:pos + 2 + length]
+                    output_pos += length
+                    pos += 2 + length
+                    offset = (pack_a & 0x3f) * 256 + pack_b + 1
+                    length = (pack_code & 0x3f) + 4
+                elif not pack_code & 0x20:
+                    pack_b, pack_c = data[pos + 1], data[pos + 2]
+                    length = pack_code & 3
+                    uncompressed[output_pos:output_pos + length] = data[pos + 3:pos + 3 + length]
+                    output_pos += length
+                    pos += 3 + length
+                    offset = ((pack_code & 0x10) << 12) + 256 * pack_a + pack_b + 1
+                    length = ((pack_code >> 2) & 3) * 256 + pack_c + 5
+                else:
+                    length = (pack_code & 0x1f) * 4 + 4
+                    uncompressed[output_pos:output_pos + length] = data[pos:pos + length]
+                    output_pos += length
+                    pos += length
+                    offset = length = 0
+                if pos > data_length:
+                    raise IndexError()
+                if length > offset:
+                    output_pos = self._reuse_bytes_in_output(uncompressed, output_pos, length, offset)
+                elif length:
+                    src = output_pos - offset
+                    if src < 0:
+                        raise ValueError(f'Error while unpacking QFS archive: back-reference offset {offset} '
+                                         f'is out of output')
+                    uncompressed[output_pos:output_pos + length] = uncompressed[src:src + length]
+                    output_pos += length
+                pack_code = data[pos]
+                pos += 1
+        except IndexError:
+            raise ValueError(f'Error while unpacking QFS archive: unexpected end of compressed data')
+        if pos < data_length and output_pos < output_length:
+            uncompressed[output_pos:output_pos + data_length - pos] = data[pos:]
+            output_pos += data_length - pos
+            pos = data_length
+        buffer.seek(start_offset + pos)
+        if output_length != output_pos:
             raise ValueError(
-                f'Error while unpacking QFS archive: expected length {output_length}, actual length: {len(uncompressed)}')
+                f'Error while unpacking QFS archive: expected length {output_length}, actual length: {output_pos}')
         return bytes(uncompressed)
+
+    # appends literals to output, returns amount of bytes (0..3), which left to be written with next command
+    @staticmethod
+    def _write_literals(output: bytearray, data: bytes, start: int, end: int) -> int:
+        while end - start >= 4:
+            length = min((end - start) & ~3, 112)
+            output.append(0xE0 | ((length - 4) >> 2))
+            output.extend(data[start:start + length])
+            start += length
+        return end - start
+
+    # length of common prefix of data[a:] and data[b:], but not bigger than max_length. First `known_length` bytes
+    # are known to be equal. Uses exponential search of mismatch, then binary search, comparing only new chunks
+    @staticmethod
+    def _match_length(data: bytes, a: int, b: int, max_length: int, known_length: int = 0) -> int:
+        low, high = known_length, known_length + 4
+        while high < max_length and data[a + low:a + high] == data[b + low:b + high]:
+            low, high = high, high * 2
+        if high > max_length:
+            high = max_length
+        if data[a + low:a + high] == data[b + low:b + high]:
+            return high
+        while high - low > 1:
+            middle = (low + high) >> 1
+            if data[a + low:a + middle] == data[b + low:b + middle]:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def compress(self, buffer: [BufferedReader, BytesIO], input_length: int):
+        data = buffer.read(input_length)
+        data_length = len(data)
+        if data_length > 0xFF_FF_FF:
+            raise ValueError(f'Cannot compress {data_length} bytes with RefPack: too big file')
+        output = bytearray([0x10, 0xFB]) + data_length.to_bytes(3, 'big')
+        window_size, effort = self.window_size, self.effort
+        match_length = self._match_length
+        write_literals = self._write_literals
+        # hash chains: last position of each 3-byte sequence and previous position with the same sequence
+        last_positions = {}
+        get_last_position = last_positions.get
+        previous_positions = [-1] * data_length
+        literal_start = 0
+        i = 0
+        while i < data_length - 2:
+            key = data[i:i + 3]
+            candidate = get_last_position(key, -1)
+            previous_positions[i] = candidate
+            last_positions[key] = i
+            if candidate < 0 or i - candidate > window_size:
+                i += 1
+                continue
+            best_length, best_offset = 0, 0
+            max_length = data_length - i
+            if max_length > 1028:
+                max_length = 1028
+            chain = effort
+            while candidate >= 0 and i - candidate <= window_size and chain:
+                chain -= 1
+                offset = i - candidate
+                # quick check of the byte, which has to match for a longer match than the best one
+                probe = best_length if best_length > 3 else 3
+                if probe < max_length and data[candidate + probe] != data[i + probe]:
+                    if best_length == 0 and offset <= 0x400:
+                        best_length, best_offset = 3, offset
+                else:
+                    length = match_length(data, candidate, i, max_length, 3)
+                    # short matches can only be encoded with small offsets
+                    if length > best_length and (length >= 5 or offset <= 0x400 or (length == 4 and offset <= 0x4000)):
+                        best_length, best_offset = length, offset
+                        if length == max_length:
+                            break
+                candidate = previous_positions[candidate]
+            if best_length < 3:
+                i += 1
+                continue
+            literals = write_literals(output, data, literal_start, i)
+            offset = best_offset - 1
+            if best_length <= 10 and best_offset <= 0x400:
+                output.append(((offset >> 8) << 5) | ((best_length - 3) << 2) | literals)
+                output.append(offset & 0xFF)
+            elif best_length <= 67 and best_offset <= 0x4000:
+                output.append(0x80 | (best_length - 4))
+                output.append((literals << 6) | (offset >> 8))
+                output.append(offset & 0xFF)
+            else:
+                output.append(0xC0 | ((offset >> 16) << 4) | (((best_length - 5) >> 8) << 2) | literals)
+                output.append((offset >> 8) & 0xFF)
+                output.append(offset & 0xFF)
+                output.append((best_length - 5) & 0xFF)
+            output.extend(data[i - literals:i])
+            # register positions inside of the match in hash chains
+            for j in range(i + 1, min(i + best_length, data_length - 2)):
+                key = data[j:j + 3]
+                previous_positions[j] = get_last_position(key, -1)
+                last_positions[key] = j
+            i += best_length
+            literal_start = i
+        literals = self._write_literals(output, data, literal_start, data_length)
+        output.append(0xFC | literals)
+        output.extend(data[data_length - literals:])
+        return bytes(output)
@@ -1,4 +1,3 @@
-from io import BufferedReader, BytesIO
 from math import floor, ceil
 from typing import Dict
 
@@ -24,9 +23,8 @@ class TnfsTopSpeed(RationalNumber):
     def __init__(self, **kwargs):
         super().__init__(length=3, is_signed=False, byte_order="little", fraction_bits=8, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        value = super().read(buffer, ctx, name, read_bytes_amount)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        value = super().from_raw_value(raw, ctx, name)
         int_part = floor(value)
         frac_part = value - int_part
         int_part = ceil(int_part * 2.240000000001)
@@ -1,4 +1,3 @@
-from io import BufferedReader, BytesIO
 from typing import Dict
 
 from library.context import ReadContext, WriteContext
@@ -6,6 +5,23 @@ from library.read_blocks import IntegerBlock, DataBlock
 from library.utils import transform_bitness, transform_color_bitness
 
 
+# vectorized version of transform_color_bitness for 16-bit colors: returns numpy RGBA uint8 array with shape
+# (colors count, 4). Channels are expanded with lookup tables, built by transform_bitness, so result is exactly the same
+def unpack_rgba_array_with_bitness(raw: bytes, byte_order, alpha_bitness, red_bitness, green_bitness, blue_bitness):
+    import numpy as np
+    values = np.frombuffer(raw, dtype='<u2' if byte_order == 'little' else '>u2')
+    res = np.empty((len(values), 4), dtype=np.uint8)
+    offset = 0
+    for channel, bitness in [(2, blue_bitness), (1, green_bitness), (0, red_bitness), (3, alpha_bitness)]:
+        if bitness == 0:
+            res[:, channel] = 0xFF
+            continue
+        table = np.array([transform_bitness(x, bitness) for x in range(1 << bitness)], dtype=np.uint8)
+        res[:, channel] = table[(values >> offset) & ((1 << bitness) - 1)]
+        offset += bitness
+    return res
+
+
 class Color24BitDosBlock(IntegerBlock):
     @property
     def schema(self) -> Dict:
@@ -17,12 +33,10 @@ class Color24BitDosBlock(IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=3, byte_order="big", **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        number = super().read(buffer, ctx, name)
-        red = transform_bitness((number & 0xFF0000) >> 16, 6)
-        green = transform_bitness((number & 0xFF00) >> 8, 6)
-        blue = transform_bitness(number & 0xFF, 6)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        red = transform_bitness((raw & 0xFF0000) >> 16, 6)
+        green = transform_bitness((raw & 0xFF00) >> 8, 6)
+        blue = transform_bitness(raw & 0xFF, 6)
         return red << 24 | green << 16 | blue << 8 | 255
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
@@ -44,10 +58,16 @@ class Color24BitBlock(IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=3, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        number = super().read(buffer, ctx, name)
-        return number << 8 | 0xFF
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return raw << 8 | 0xFF
+
+    # vectorized read of many colors at once. Returns numpy RGBA uint8 array with shape (colors count, 4)
+    def unpack_rgba_array(self, raw: bytes):
+        import numpy as np
+        channels = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        res = np.full((len(channels), 4), 0xFF, dtype=np.uint8)
+        res[:, :3] = channels if self.byte_order == 'big' else channels[:, ::-1]
+        return res
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         return super().write(data >> 8, ctx, name)
@@ -73,11 +93,16 @@ class Color32BitBlock(IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=4, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        number = super().read(buffer, ctx, name)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        # ARGB => RGBA
+        return (raw & 0x00_ff_ff_ff) << 8 | (raw & 0xff_00_00_00) >> 24
+
+    def unpack_rgba_array(self, raw: bytes):
+        import numpy as np
+        channels = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 4)
         # ARGB => RGBA
-        return (number & 0x00_ff_ff_ff) << 8 | (number & 0xff_00_00_00) >> 24
+        return np.ascontiguousarray(channels[:, [2, 1, 0, 3]] if self.byte_order == 'little'
+                                    else channels[:, [1, 2, 3, 0]])
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         # RGBA => ARGB
@@ -98,14 +123,18 @@ class Color16Bit0565Block(IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=2, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        number = super().read(buffer, ctx, name)
-        value = transform_color_bitness(number, 0, 5, 6, 5)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        value = transform_color_bitness(raw, 0, 5, 6, 5)
         if value == self.transparent_color:
             value = 0
         return value
 
+    def unpack_rgba_array(self, raw: bytes):
+        import numpy as np
+        res = unpack_rgba_array_with_bitness(raw, self.byte_order, 0, 5, 6, 5)
+        res[(res == np.frombuffer(self.transparent_color.to_bytes(4, 'big'), dtype=np.uint8)).all(axis=1)] = 0
+        return res
+
     def write(self, value, ctx: WriteContext = None, name: str = '') -> bytes:
         if (value & 0xff) < 128:
             value = self.transparent_color
@@ -128,11 +157,8 @@ class Color16BitDosBlock(IntegerBlock):
         super().__init__(length=2, **kwargs)
 
     # TODO colors not tested!
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        number = super().read(buffer, ctx, name)
-        value = transform_color_bitness(number, 0, 5, 6, 5)
-        return value
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return transform_color_bitness(raw, 0, 5, 6, 5)
 
     def write(self, value, ctx: WriteContext = None, name: str = '') -> bytes:
         red = (value & 0xff000000) >> 27
@@ -154,10 +180,11 @@ class Color16Bit1555Block(IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=2, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        number = super().read(buffer, ctx, name)
-        return transform_color_bitness(number, 1, 5, 5, 5)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return transform_color_bitness(raw, 1, 5, 5, 5)
+
+    def unpack_rgba_array(self, raw: bytes):
+        return unpack_rgba_array_with_bitness(raw, self.byte_order, 1, 5, 5, 5)
 
     def write(self, value, ctx: WriteContext = None, name: str = '') -> bytes:
         red = (value & 0xff000000) >> 27
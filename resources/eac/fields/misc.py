@@ -1,4 +1,3 @@
-from io import BufferedReader, BytesIO
 from typing import Dict
 
 from library.context import WriteContext, ReadContext
@@ -107,13 +106,11 @@ class FenceType(IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=1, is_signed=False, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        fence_type = super().read(buffer, ctx, name, read_bytes_amount)
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
         return {
-            'texture_id': fence_type & (0xff >> 2),
-            'has_left_fence': (fence_type & (0x1 << 7)) != 0,
-            'has_right_fence': (fence_type & (0x1 << 6)) != 0,
+            'texture_id': raw & (0xff >> 2),
+            'has_left_fence': (raw & (0x1 << 7)) != 0,
+            'has_right_fence': (raw & (0x1 << 6)) != 0,
         }
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
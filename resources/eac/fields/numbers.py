@@ -1,5 +1,4 @@
 import math
-from io import BufferedReader, BytesIO
 from typing import Dict
 
 from library.context import ReadContext, WriteContext
@@ -27,9 +26,8 @@ class RationalNumber(IntegerBlock):
         super().__init__(**kwargs)
         self.fraction_bits = fraction_bits
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        return float(super().read(buffer, ctx, name, read_bytes_amount) / (1 << self.fraction_bits))
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return float(raw / (1 << self.fraction_bits))
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         data = max(min(round(data * (1 << self.fraction_bits)),
@@ -62,9 +60,8 @@ class Nfs1Angle8(AngleBlock, IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=1, is_signed=False, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        return float((super().read(buffer, ctx, name, read_bytes_amount) / 256) * (math.pi * 2))
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return float((raw / 256) * (math.pi * 2))
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         value = self.wrap_angle(data)
@@ -88,9 +85,8 @@ class Nfs1Angle14(AngleBlock, IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=2, byte_order='little', is_signed=False, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        return float(((super().read(buffer, ctx, name, read_bytes_amount) & 0x3FFF) / 0x4000) * (math.pi * 2))
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return float(((raw & 0x3FFF) / 0x4000) * (math.pi * 2))
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         value = self.wrap_angle(data)
@@ -114,9 +110,8 @@ class Nfs1Angle16(AngleBlock, IntegerBlock):
     def __init__(self, **kwargs):
         super().__init__(length=2, byte_order='little', is_signed=False, **kwargs)
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        return float((super().read(buffer, ctx, name, read_bytes_amount) / 0x10000) * (math.pi * 2))
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return float((raw / 0x10000) * (math.pi * 2))
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         value = self.wrap_angle(data)
@@ -137,9 +132,8 @@ class Nfs1TimeField(IntegerBlock):
             'block_description': f'TNFS time field. {super_schema["block_description"]}, '
                                  'equals to amount of ticks (amount of seconds * 60)'}
 
-    def read(self, buffer: [BufferedReader, BytesIO], ctx: ReadContext = DataBlock.root_read_ctx, name: str = '',
-             read_bytes_amount=None):
-        return float(super().read(buffer, ctx, name, read_bytes_amount)) / 60
+    def from_raw_value(self, raw: int, ctx: ReadContext = DataBlock.root_read_ctx, name: str = ''):
+        return float(raw) / 60
 
     def write(self, data, ctx: WriteContext = None, name: str = '') -> bytes:
         return super().write(int(data * 60), ctx, name)
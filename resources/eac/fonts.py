@@ -38,7 +38,7 @@ class FfnFont(DeclarativeCompoundBlock):
                        {'description': 'Resource ID'})
         block_size = (IntegerBlock(length=4),
                       {'description': 'The length of this FFN block in bytes',
-                       'programmatic_value': lambda ctx: ctx.block.estimate_packed_size(ctx.get_full_data())})
+                       'programmatic_value': lambda ctx: ctx.get_packed_size(ctx.block, ctx.get_full_data())})
         unk0 = (IntegerBlock(length=1, required_value=100),
                 {'is_unknown': True})
         unk1 = (IntegerBlock(length=1, required_value=0),
@@ -59,7 +59,7 @@ class FfnFont(DeclarativeCompoundBlock):
         bdata_ptr = (IntegerBlock(length=2),
                      {'description': 'Pointer to bitmap block',
                       'programmatic_value': lambda ctx: ctx.block.offset_to_child_when_packed(ctx.get_full_data(),
-                                                                                              'bitmap')})
+                                                                                              'bitmap', ctx)})
         unk5 = (IntegerBlock(length=1, required_value=0),
                 {'is_unknown': True})
         unk6 = (IntegerBlock(length=1, required_value=0),
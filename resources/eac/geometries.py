@@ -143,7 +143,7 @@ class OripGeometry(DeclarativeCompoundBlock):
         vrtx_ptr = (IntegerBlock(length=4),
                     {'description': 'An offset to vertices',
                      'programmatic_value': lambda ctx: ctx.block.offset_to_child_when_packed(ctx.get_full_data(),
-                                                                                             'vertices')})
+                                                                                             'vertices', ctx)})
         num_uvs = (IntegerBlock(length=4),
                    {'description': 'Amount of vertex UV-s (texture coordinates)',
                     'programmatic_value': lambda ctx: len(ctx.data('vertex_uvs'))})
@@ -181,7 +181,7 @@ class OripGeometry(DeclarativeCompoundBlock):
         vmap_ptr = (IntegerBlock(length=4),
                     {'description': 'Offset of polygon_vertex_map block',
                      'programmatic_value': lambda ctx: ctx.block.offset_to_child_when_packed(ctx.get_full_data(),
-                                                                                             'vmap')})
+                                                                                             'vmap', ctx)})
         num_lbl0 = (IntegerBlock(length=4),
                     {'description': 'Amount of items in labels0 block',
                      'programmatic_value': lambda ctx: len(ctx.data('labels0'))})
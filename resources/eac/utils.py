@@ -2,6 +2,18 @@ from resources.eac.archives import ShpiBlock, WwwwBlock
 from resources.eac.bitmaps import Bitmap8Bit
 from resources.eac.palettes import BasePalette, PaletteReference
 
+# TNFS has QFS files without palette in ART/CONTROL directory, palette is taken from CENTRAL.QFS in the same directory
+CONTROL_PALETTE_FILE_NAME = 'CENTRAL.QFS'
+
+
+# returns path of another file, which palette for 8-bit bitmaps in the file at given path is taken from, or None.
+# Used by converter to convert files, which share the same palette file, in the same process
+def get_external_palette_file(path: str):
+    path = path.replace('\\', '/')
+    if 'ART/CONTROL/' not in path or path.endswith('/' + CONTROL_PALETTE_FILE_NAME):
+        return None
+    return path[:path.rfind('/')] + '/' + CONTROL_PALETTE_FILE_NAME
+
 
 def _get_palette_from_shpi(shpi_block, shpi_data: dict):
     # some of SHPI directories have upper-cased name of palette. Happens in TNFS track FAM files
@@ -85,6 +97,6 @@ def determine_palette_for_8_bit_bitmap(block: Bitmap8Bit, data: dict, id: str) -
             # TNFS has QFS files without palette in this directory, and 7C bitmap resource data seems to not differ in this case :(
             from library import require_resource
             (_, shpi_block, shpi_data), _ = require_resource(
-                '/'.join(id.split('__')[0].split('/')[:-1]) + '/CENTRAL.QFS__data')
+                '/'.join(id.split('__')[0].split('/')[:-1]) + f'/{CONTROL_PALETTE_FILE_NAME}__data')
             (palette_block, palette_data) = _get_palette_from_shpi(shpi_block, shpi_data)
     return palette_block, palette_data
@@ -8,6 +8,7 @@ class Action(Enum):
     convert = 'convert'
     gui = 'gui'
     custom_command = 'custom_command'
+    extract = 'extract'
 
     def __str__(self):
         return self.value
@@ -18,8 +19,9 @@ if __name__ == "__main__":
     parser.add_argument('action', type=Action, choices=list(Action), default=Action.gui, help='An action to perform')
     parser.add_argument('--custom-command', type=str, required=False, help='Name of custom function to run (action "custom_command" only)')
     parser.add_argument('--custom-command-args', nargs='*', required=False, default=[], help='Arguments for custom command (action "custom_command" only)')
-    parser.add_argument('file', type=pathlib.Path, help='Input path')
-    parser.add_argument('--out', type=pathlib.Path, required=False, help='Output path for converted files (action "convert" only)', default='out/')
+    parser.add_argument('file', type=pathlib.Path, help='Input path (resource id for action "extract")')
+    parser.add_argument('--out', type=pathlib.Path, required=False, help='Output path for converted files (actions "convert", "extract" only)', default='out/')
+    parser.add_argument('--incremental', action='store_true', help='Convert only files, changed since the previous run with the same output path (action "convert" only)')
     args = parser.parse_args()
     if args.action == Action.gui:
         if os.path.isdir(args.file):
@@ -30,7 +32,12 @@ if __name__ == "__main__":
         if not args.out:
             raise Exception('--out argument has to be provided for convert action')
         from actions.convert_all import convert_all
-        convert_all(args.file, args.out)
+        convert_all(args.file, args.out, incremental=args.incremental)
+    elif args.action == Action.extract:
+        if not args.out:
+            raise Exception('--out argument has to be provided for extract action')
+        from actions.extract_resource import extract_resource
+        extract_resource(str(args.file), args.out)
     elif args.action == Action.custom_command:
         if os.path.isdir(args.file):
             raise Exception('Cannot run custom command on directory, use path to file')
@@ -46,11 +53,11 @@ if __name__ == "__main__":
         if os.path.isdir(args.out) or out_path[-4:] != str(args.file)[-4:]:
             os.makedirs(out_path, exist_ok=True)
             out_path += '/' + str(args.file).split('/')[-1]
-        f = open(out_path, 'wb')
-        try:
-            f.write(block.pack(resource))
-            print('Finished!')
-            print(f'Support me :) >>>  https://www.buymeacoffee.com/andygura <<<')
-        finally:
-            f.close()
+        from library.utils.buffer_utils import materialize_views
+        from library.utils.file_utils import pack_to_file
+        # output file can be the memory-mapped input file
+        materialize_views(resource)
+        pack_to_file(block, resource, out_path)
+        print('Finished!')
+        print(f'Support me :) >>>  https://www.buymeacoffee.com/andygura <<<')
 
@@ -5,6 +5,7 @@ import tempfile
 from wave import Wave_write
 
 from library.utils import audio_ima_adpcm_codec
+from library.utils.profiling import external_tool_timer
 from serializers import BaseFileSerializer
 
 
@@ -40,7 +41,7 @@ class EacsAudioSerializer(BaseFileSerializer):
                     ending = (data['header']['sound_resolution']
                               * int((data['header']['repeat_loop_beginning'] + data['header']['repeat_loop_length'])
                                     / data['header']['channels']) * data['header']['channels'])
-                    loop_wave_data = wave_bytes[beginning:ending] * 16
+                    loop_wave_data = bytes(wave_bytes[beginning:ending]) * 16
             except Exception:
                 pass
         self._save_wave_data(data['header'], wave_bytes, path)
@@ -64,7 +65,8 @@ class EacsAudioSerializer(BaseFileSerializer):
             args = [self.settings.ffmpeg_executable, "-y", "-nostats", '-loglevel', '0', "-i",
                     file.name.replace('\\', '/'),
                     f'{path}.mp3']
-            subprocess.run(args, check=True)
+            with external_tool_timer():
+                subprocess.run(args, check=True)
         except Exception as ex:
             raise ex
         finally:
@@ -76,9 +78,10 @@ class FfmpegSupportedAudioSerializer(BaseFileSerializer):
 
     def serialize(self, data: dict, path: str, id=None, block=None, **kwargs):
         super().serialize(data, path)
-        subprocess.run(
-            [self.settings.ffmpeg_executable, "-y", "-nostats", '-loglevel', '0', "-i", id, f'{path}.mp3'],
-            check=True)
+        with external_tool_timer():
+            subprocess.run(
+                [self.settings.ffmpeg_executable, "-y", "-nostats", '-loglevel', '0', "-i", id, f'{path}.mp3'],
+                check=True)
         with open(f'{path}.meta.json', 'w') as file:
             loop_start_time_ms = 1000 * data['repeat_loop_beginning'] / data['sampling_rate']
             loop_end_time_ms = loop_start_time_ms + 1000 * data['repeat_loop_length'] / data['sampling_rate']
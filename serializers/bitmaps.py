@@ -1,5 +1,6 @@
 from typing import Any
 
+import numpy as np
 from PIL import Image
 
 from library.exceptions import SerializationException
@@ -14,6 +15,11 @@ class BitmapSerializer(BaseFileSerializer):
     def serialize(self, data: dict, path: str, id=None, block=None, **kwargs):
         super().serialize(data, path, id=id, block=block)
         bitmap = data['bitmap']
+        if not isinstance(bitmap, list):
+            # numpy RGBA array
+            Image.fromarray(bitmap.reshape((data['height'], data['width'], 4)),
+                            'RGBA').save(f'{escape_chars(path)}.png')
+            return
         if isinstance(block, Bitmap4Bit):
             bitmap = [item for row in bitmap for item in row]
         Image.frombytes('RGBA',
@@ -44,7 +50,6 @@ class BitmapWithPaletteSerializer(BaseFileSerializer):
         (palette_block, palette_data) = determine_palette_for_8_bit_bitmap(block, data, id)
         if palette_block is None:
             raise SerializationException('Palette not found for 8bit bitmap')
-        colors = []
         palette_colors = [c for c in palette_data['colors']]
         if palette_data['last_color_transparent']:
             palette_colors[255] = 0
@@ -55,14 +60,13 @@ class BitmapWithPaletteSerializer(BaseFileSerializer):
             except IndexError:
                 print('WARN: car tail lights problem: palette is too short')
                 pass
-        for index in data['bitmap']:
-            try:
-                colors.append(palette_colors[index])
-            except IndexError:
-                colors.append(0)
+        # lookup table for all possible indexes, indexes outside of palette are transparent
+        lookup_table = np.zeros(256, dtype='>u4')
+        lookup_table[:min(len(palette_colors), 256)] = palette_colors[:256]
+        indexes = np.frombuffer(bytes(data['bitmap']), dtype=np.uint8)
         Image.frombytes('RGBA',
                         (data['width'], data['height']),
-                        bytes().join([c.to_bytes(4, 'big') for c in colors])).save(f'{escape_chars(path)}.png')
+                        lookup_table[indexes].tobytes()).save(f'{escape_chars(path)}.png')
 
     def deserialize(self, path: str, id=None, block=None, palette=None, **kwargs):
         source = Image.open(path)
@@ -6,6 +6,7 @@ from string import Template
 from typing import List, Dict
 
 from library.utils.blender_scripts import get_blender_save_script, run_blender
+from library.utils.buffer_utils import copy_data
 from library.utils.meshes import SubMesh
 from resources.eac.maps import RoadSplinePoint
 from serializers import BaseFileSerializer
@@ -477,7 +478,7 @@ if $save_terrain_collisions:
     def serialize(self, data: dict, path: str, id=None, block=None, **kwargs):
         super().serialize(data, path)
         # this serializer mutates data when exchanging axis to Z-up
-        data = deepcopy(data)
+        data = copy_data(data)
         is_opened_track = data['loop_chunk'] == 0
 
         terrain_data = []
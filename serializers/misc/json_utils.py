@@ -1,5 +1,5 @@
 def convert_bytes(data):
-    if isinstance(data, bytes):
+    if isinstance(data, (bytes, memoryview)):
         return list(data)
     elif isinstance(data, dict):
         return {key: convert_bytes(value) for key, value in data.items()}
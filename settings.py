@@ -10,6 +10,32 @@ multiprocess_processes_count = 0
 print_errors = False
 print_blender_log = False
 
+# max estimated memory size (in bytes) of parsed files, kept in memory by every process. When exceeded, least
+# recently used files are dropped from memory. None means no limit
+files_cache_max_size = 1024 * 1024 * 1024
+
+# read files via memory mapping. Binary payloads of parsed files are not copied to memory, but reference mapped file
+# instead. Decreases memory usage for big archives
+mmap_input_files = False
+
+# parse children of wwww and BIGF archives only when they are accessed. Speeds up resolving single resources from
+# big archives. Cannot be used together with parse cache
+lazy_archive_children = False
+
+# directory for persistent cache of parsed files. When set, next runs on unchanged files load parsed data from the
+# cache instead of parsing them again. Cache is invalidated automatically when file or parser code changes.
+# None disables the cache
+parse_cache_directory = None
+
+# save conversion_report.json and conversion_report.csv to the output directory: parse, serialize, external tools
+# (blender, ffmpeg) time, peak memory usage and output size of every converted file, aggregated by resource class
+save_conversion_report = False
+
+# files with the same name and content (e.g. the same resources in different language directories) are converted once,
+# outputs are copied for others. 'copy' - copy outputs, 'hardlink' - create hard links (saves disk space, but editing
+# one output changes all of them), None - convert every file
+deduplicate_inputs = None
+
 # ================================================= CONVERTING OPTIONS =================================================
 # classes map, which export blocks data to common formats
 SERIALIZER_CLASSES = {
@@ -45,6 +71,9 @@ SERIALIZER_CLASSES = {
 
 # skip saving palette, image positions
 images__save_images_only = False
+# unpack 16/24/32-bit bitmaps to numpy RGBA arrays instead of lists of integers. Much faster, but GUI editor
+# cannot display such data
+images__unpack_to_numpy_arrays = False
 
 # for car sfx for engine, honk, additionally export long audio, where the sample repeated 16 times
 audio__save_car_sfx_loops = False
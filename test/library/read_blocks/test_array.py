@@ -1,7 +1,7 @@
 import unittest
 from io import BytesIO
 
-from library.exceptions import DataIntegrityException
+from library.exceptions import DataIntegrityException, EndOfBufferException
 from library.read_blocks import UTF8Block
 from library.read_blocks.array import ArrayBlock, SubByteArrayBlock
 from library.read_blocks.numbers import IntegerBlock
@@ -14,6 +14,19 @@ class TestArray(unittest.TestCase):
         val = field.unpack(BytesIO(bytes([92, 129, 13])))
         self.assertListEqual(val, [92, 129, 13])
 
+    def test_array_unpack_dynamic_length_static_child(self):
+        field = ArrayBlock(length=lambda ctx: 3, child=IntegerBlock(length=2, is_signed=True))
+        val = field.unpack(BytesIO(bytes([1, 0, 0xFF, 0xFF, 2, 1])))
+        self.assertListEqual(val, [1, -1, 258])
+        with self.assertRaises(EndOfBufferException):
+            field.unpack(BytesIO(bytes([1, 0, 0xFF, 0xFF, 2])))
+
+    def test_array_unpack_dynamic_length_validated_child(self):
+        field = ArrayBlock(length=lambda ctx: 2, child=IntegerBlock(length=2, required_value=5))
+        self.assertListEqual(field.unpack(BytesIO(bytes([5, 0, 5, 0]))), [5, 5])
+        with self.assertRaises(DataIntegrityException):
+            field.unpack(BytesIO(bytes([5, 0, 6, 0])))
+
     def test_array_pack(self):
         field = ArrayBlock(length=3, child=IntegerBlock(length=1))
         data = field.pack([92, 129, 13])
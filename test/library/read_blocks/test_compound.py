@@ -1,6 +1,7 @@
 import unittest
 from io import BytesIO
 
+from library.exceptions import DataIntegrityException
 from library.read_blocks import ArrayBlock, DeclarativeCompoundBlock, IntegerBlock, UTF8Block, CompoundBlock
 
 
@@ -14,6 +15,21 @@ class TestCompound(unittest.TestCase):
         val = field.unpack(BytesIO(bytes([92, 129])))
         self.assertDictEqual(val, {'a': 92, 'b': 129})
 
+    def test_unpack_static_nested_fields(self):
+        field = CompoundBlock(fields=[
+            ('a', IntegerBlock(length=2, is_signed=True), {}),
+            ('b', CompoundBlock(fields=[
+                ('c', IntegerBlock(length=1, required_value=7), {}),
+                ('d', ArrayBlock(length=2, child=IntegerBlock(length=2, byte_order='big')), {}),
+            ]), {}),
+            ('e', UTF8Block(length=4), {}),
+            ('f', IntegerBlock(length=3), {}),
+        ])
+        val = field.unpack(BytesIO(bytes([0xFE, 0xFF, 7, 1, 2, 3, 4]) + b'ab\x00\x00' + bytes([1, 2, 3])))
+        self.assertDictEqual(val, {'a': -2, 'b': {'c': 7, 'd': [258, 772]}, 'e': 'ab', 'f': 0x030201})
+        with self.assertRaises(DataIntegrityException):
+            field.unpack(BytesIO(bytes([0xFE, 0xFF, 8, 1, 2, 3, 4]) + b'ab\x00\x00' + bytes([1, 2, 3])))
+
     def test_pack(self):
         field = CompoundBlock(fields=[
             ('a', IntegerBlock(length=1), {}),
@@ -22,6 +38,40 @@ class TestCompound(unittest.TestCase):
         data = field.pack({'a': 92, 'b': 129})
         self.assertEqual(data, bytes([92, 129]))
 
+    def test_write_into_shared_buffer(self):
+        field = CompoundBlock(fields=[
+            ('a', IntegerBlock(length=1), {}),
+            ('b', ArrayBlock(length=2, child=IntegerBlock(length=2)), {}),
+            ('checksum', IntegerBlock(length=1), {'programmatic_value': lambda ctx: sum(ctx.result)}),
+        ])
+        buffer = bytearray(b'\xff')
+        field.write_into(buffer, {'a': 1, 'b': [2, 3]})
+        self.assertEqual(buffer, bytes([0xff, 1, 2, 0, 3, 0, 6]))
+        self.assertEqual(field.pack({'a': 1, 'b': [2, 3]}), bytes([1, 2, 0, 3, 0, 6]))
+
+    def test_estimate_packed_size_memoized_during_write(self):
+        estimations = []
+
+        class CountingBlock(CompoundBlock):
+            def estimate_packed_size(self, data, ctx=None):
+                estimations.append(data)
+                return super().estimate_packed_size(data, ctx)
+
+        field = CompoundBlock(fields=[
+            ('ptr_a', IntegerBlock(length=1),
+             {'programmatic_value': lambda ctx: ctx.block.offset_to_child_when_packed(ctx.get_full_data(), 'a', ctx)}),
+            ('ptr_b', IntegerBlock(length=1),
+             {'programmatic_value': lambda ctx: ctx.block.offset_to_child_when_packed(ctx.get_full_data(), 'b', ctx)}),
+            ('size', IntegerBlock(length=1),
+             {'programmatic_value': lambda ctx: ctx.get_packed_size(ctx.block, ctx.get_full_data())}),
+            ('header', CountingBlock(fields=[('x', IntegerBlock(length=2), {})]), {}),
+            ('a', IntegerBlock(length=1), {}),
+            ('b', IntegerBlock(length=1), {}),
+        ])
+        data = {'header': {'x': 1}, 'a': 2, 'b': 3}
+        self.assertEqual(field.pack(data), bytes([5, 6, 7, 1, 0, 2, 3]))
+        self.assertEqual(len(estimations), 1)
+
     def test_get_child_block_with_data(self):
         child_block = IntegerBlock(length=1)
         field = CompoundBlock(fields=[
@@ -0,0 +1,52 @@
+import unittest
+
+import settings
+from library.files_cache import FilesCache, estimate_data_size
+from library.loader import require_file, files_cache
+
+
+class TestFilesCache(unittest.TestCase):
+
+    def setUp(self):
+        self.initial_max_size = settings.files_cache_max_size
+
+    def tearDown(self):
+        settings.files_cache_max_size = self.initial_max_size
+
+    def test_evicts_least_recently_used(self):
+        cache = FilesCache()
+        data = [bytes(1000)]
+        settings.files_cache_max_size = estimate_data_size(data) * 2
+        cache.put('a', 'block_a', data)
+        cache.put('b', 'block_b', data)
+        self.assertEqual(cache.get('a'), ('block_a', data))
+        cache.put('c', 'block_c', data)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.get('b'), (None, None))
+        self.assertDictEqual(cache.stats, {'files': 2, 'size': estimate_data_size(data) * 2, 'pinned': 0,
+                                           'hits': 1, 'misses': 1, 'evictions': 1})
+
+    def test_pinned_files_are_not_evicted(self):
+        cache = FilesCache()
+        data = [bytes(1000)]
+        settings.files_cache_max_size = estimate_data_size(data)
+        cache.put('a', 'block_a', data)
+        cache.pin('a')
+        cache.put('b', 'block_b', data)
+        cache.put('c', 'block_c', data)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        cache.unpin('a')
+        self.assertNotIn('a', cache)
+        self.assertIn('c', cache)
+
+    def test_reparse_evicted_archive(self):
+        settings.files_cache_max_size = 1
+        (name, _, data) = require_file('test/samples/AL2.QFS')
+        require_file('test/samples/LDIABL.PBS_UNCOMPRESSED')
+        self.assertNotIn(name, files_cache)
+        (_, _, reparsed_data) = require_file('test/samples/AL2.QFS')
+        self.assertEqual(len(reparsed_data['data']['children']), len(data['data']['children']))
@@ -0,0 +1,44 @@
+import unittest
+from io import BytesIO
+
+from library.loader import probe_block_class, register_block_class
+from library.read_blocks import DeclarativeCompoundBlock, UTF8Block, IntegerBlock
+
+
+@register_block_class(header_strings=['TsT!'])
+class RegisteredTestBlock(DeclarativeCompoundBlock):
+    class Fields(DeclarativeCompoundBlock.Fields):
+        header = UTF8Block(length=4, required_value='TsT!')
+        value = IntegerBlock(length=1)
+
+
+register_block_class(RegisteredTestBlock, suffixes=['/nfsrc_test_DATA'])
+
+
+class TestProbeBlockClass(unittest.TestCase):
+
+    def test_builtin_classes(self):
+        from resources.eac.archives import ShpiBlock, RefPackBlock, SoundBank
+        from resources.eac.maps import TriMap
+        from resources.eac.geometries import GeoGeometry
+        self.assertIs(probe_block_class(BytesIO(b'SHPI\0\0\0\0')), ShpiBlock)
+        self.assertIs(probe_block_class(BytesIO(b'\x11\xfb\0\0')), RefPackBlock)
+        self.assertIs(probe_block_class(BytesIO(b'\x11\0\0\0')), TriMap)
+        self.assertIs(probe_block_class(BytesIO(b'SHPI\0\0\0\0'), file_path='/data/DIABLOSW.BNK'), SoundBank)
+        self.assertIs(probe_block_class(BytesIO(b'\0\0\0\0'), file_path='/data/car.geo'), GeoGeometry)
+
+    def test_registered_class(self):
+        buffer = BytesIO(b'TsT!\x07')
+        self.assertIs(probe_block_class(buffer), RegisteredTestBlock)
+        self.assertEqual(buffer.tell(), 0)
+        with self.assertRaises(NotImplementedError):
+            probe_block_class(buffer, resources_to_pick=[DeclarativeCompoundBlock])
+        with self.assertRaises(NotImplementedError):
+            probe_block_class(BytesIO(b'TsT?\x07'))
+
+    def test_suffix_without_extension(self):
+        self.assertIs(probe_block_class(BytesIO(b'\0\0\0\0'), file_path='/data/nfsrc_test_DATA'), RegisteredTestBlock)
+        self.assertIs(probe_block_class(BytesIO(b'\0\0\0\0'), file_path='/data.dir/nfsrc_test_DATA'),
+                      RegisteredTestBlock)
+        with self.assertRaises(NotImplementedError):
+            probe_block_class(BytesIO(b'\0\0\0\0'), file_path='/data/nfsrc_test_DATA.A')
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import settings
+from library import loader
+from library.loader import require_file, clear_file_cache
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.initial_cache_directory = settings.parse_cache_directory
+        settings.parse_cache_directory = self.cache_dir.name
+
+    def tearDown(self):
+        settings.parse_cache_directory = self.initial_cache_directory
+        self.cache_dir.cleanup()
+
+    def test_second_load_skips_parsing(self):
+        path = 'test/samples/LDIABL.PBS_UNCOMPRESSED'
+        clear_file_cache(path)
+        (_, block, data) = require_file(path)
+        clear_file_cache(path)
+        with mock.patch.object(loader, 'probe_block_class', side_effect=AssertionError('File parsed again')):
+            (_, cached_block, cached_data) = require_file(path)
+        clear_file_cache(path)
+        self.assertIs(type(cached_block), type(block))
+        self.assertEqual(cached_data, data)
+
+    def test_changed_file_is_parsed_again(self):
+        with open('test/samples/LDIABL.PBS_UNCOMPRESSED', 'rb') as f:
+            raw = f.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'CAR.PBS_UNCOMPRESSED')
+            with open(path, 'wb') as f:
+                f.write(raw)
+            require_file(path)
+            clear_file_cache(path)
+            with open(path, 'wb') as f:
+                f.write(raw[:-4])
+            with mock.patch.object(loader, 'probe_block_class', side_effect=NotImplementedError()):
+                with self.assertRaises(NotImplementedError):
+                    require_file(path)
@@ -0,0 +1,64 @@
+import unittest
+from io import SEEK_CUR, BytesIO
+
+from library.utils.buffer_utils import MmapFileReader, materialize_views, copy_data, StreamWriteBuffer
+from resources.eac.archives import BigfBlock
+
+
+class TestMmapFileReader(unittest.TestCase):
+
+    def test_read_and_seek(self):
+        with open('test/samples/LDIABL.PBS', 'rb') as f:
+            raw = f.read()
+        with MmapFileReader('test/samples/LDIABL.PBS') as reader:
+            self.assertEqual(reader.read(4), raw[:4])
+            reader.seek(-2, SEEK_CUR)
+            view = reader.read_view(10)
+            self.assertIsInstance(view, memoryview)
+            self.assertEqual(view, raw[2:12])
+            self.assertEqual(reader.tell(), 12)
+            reader.seek(len(raw) - 3)
+            self.assertEqual(reader.read(10), raw[-3:])
+            self.assertEqual(reader.read(), b'')
+
+    def test_unpack_bigf_without_copying_payloads(self):
+        block = BigfBlock()
+        with open('test/samples/CARDATA.VIV', 'rb') as f:
+            expected = block.pack(block.unpack(f))
+        with MmapFileReader('test/samples/CARDATA.VIV') as reader:
+            data = block.unpack(reader)
+        self.assertIsInstance(data['offset_payloads'][0], memoryview)
+        self.assertEqual(block.pack(data), expected)
+        copied = copy_data(data)
+        self.assertIsInstance(copied['offset_payloads'][0], bytes)
+        self.assertEqual(block.pack(copied), expected)
+        materialize_views(data)
+        self.assertIsInstance(data['offset_payloads'][0], bytes)
+        self.assertEqual(block.pack(data), expected)
+
+
+class TestStreamWriteBuffer(unittest.TestCase):
+
+    def test_flush_read_back_and_patch(self):
+        stream = BytesIO(b'head')
+        stream.seek(4)
+        buffer = StreamWriteBuffer(stream, chunk_size=4)
+        buffer += b'abc'
+        self.assertEqual(stream.getvalue(), b'head')
+        buffer += b'def'
+        buffer += b'g'
+        self.assertEqual(stream.getvalue(), b'headabcdef')
+        self.assertEqual(len(buffer), 7)
+        self.assertEqual(buffer[4:], b'efg')
+        buffer[1:6] = b'BCDEF'
+        self.assertEqual(buffer[:], b'aBCDEFg')
+        buffer.flush()
+        self.assertEqual(stream.getvalue(), b'headaBCDEFg')
+
+    def test_pack_into(self):
+        block = BigfBlock()
+        with open('test/samples/CARDATA.VIV', 'rb') as f:
+            data = block.unpack(f)
+        stream = BytesIO()
+        self.assertEqual(block.pack_into(stream, data), stream.tell())
+        self.assertEqual(stream.getvalue(), block.pack(data))
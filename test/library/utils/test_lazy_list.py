@@ -0,0 +1,27 @@
+import copy
+import unittest
+
+from library.utils.lazy_list import LazyList
+
+
+class TestLazyList(unittest.TestCase):
+
+    def test_loads_items_on_access(self):
+        loaded = []
+        items = LazyList(4, lambda i: loaded.append(i) or i * 10)
+        self.assertEqual(len(items), 4)
+        self.assertEqual(items[2], 20)
+        self.assertEqual(items[-1], 30)
+        self.assertEqual(items[2], 20)
+        self.assertEqual(loaded, [2, 3])
+        self.assertEqual(items.loaded_items(), [20, 30])
+        with self.assertRaises(IndexError):
+            items[4]
+        self.assertEqual(items, [0, 10, 20, 30])
+        self.assertEqual(loaded, [2, 3, 0, 1])
+
+    def test_copy_is_regular_list(self):
+        items = LazyList(3, lambda i: [i])
+        copied = copy.deepcopy(items)
+        self.assertIs(type(copied), list)
+        self.assertEqual(copied, [[0], [1], [2]])
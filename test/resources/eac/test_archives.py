@@ -1,6 +1,10 @@
 import unittest
+from io import BytesIO
 
+import settings
 from library import require_file
+from library.utils.buffer_utils import MmapFileReader
+from resources.eac.archives import WwwwBlock, SoundBank
 
 
 class TestShpiBlock(unittest.TestCase):
@@ -26,6 +30,15 @@ class TestShpiBlock(unittest.TestCase):
                 self.assertEqual(x, output[i], f"Wrong value at index {i}")
 
 
+class TestRefPackBlock(unittest.TestCase):
+
+    def test_qfs_should_remain_the_same_after_recompression(self):
+        (name, block, qfs) = require_file('test/samples/AL3.QFS')
+        output = block.pack(qfs, name=name)
+        self.assertEqual(output[:2], bytes([0x10, 0xFB]))
+        self.assertDictEqual(block.unpack(BytesIO(output), name=name, read_bytes_amount=len(output)), qfs)
+
+
 class TestWwwwBlock(unittest.TestCase):
 
     def test_cfm_should_remain_the_same(self):
@@ -37,6 +50,39 @@ class TestWwwwBlock(unittest.TestCase):
             for i, x in enumerate(original):
                 self.assertEqual(x, output[i], f"Wrong value at index {i}")
 
+    def test_parse_abs_offsets(self):
+        block = WwwwBlock()
+        self.assertEqual(block.parse_abs_offsets(100, {'items_descr': [40, 16, 40, 64]}, 80),
+                         [('0', 140, 24), ('1', 116, 24), ('2', 140, 24), ('3', 164, 16)])
+
+    def test_cfm_layout_planning(self):
+        with open('test/samples/LDIABL.CFM', 'rb') as bdata:
+            original = bdata.read()
+        (_, _, res) = require_file('test/samples/LDIABL.CFM')
+        block = WwwwBlock()
+        self.assertEqual(block.plan_layout(res)['length'], len(original))
+        # wrong estimation of child size makes archive to patch header after writing children
+        child_block = block.field_blocks_map['children'].child.possible_blocks[res['children'][0]['choice_index']]
+        child_block.estimate_packed_size = lambda data, ctx=None: 1
+        self.assertEqual(block.pack(res), original)
+
+    def test_cfm_lazy_children(self):
+        with open('test/samples/LDIABL.CFM', 'rb') as bdata:
+            original = bdata.read()
+        initial_lazy = settings.lazy_archive_children
+        settings.lazy_archive_children = True
+        try:
+            block = WwwwBlock()
+            res = block.unpack(BytesIO(original), name='LDIABL.CFM', read_bytes_amount=len(original))
+        finally:
+            settings.lazy_archive_children = initial_lazy
+        children = res['children']
+        self.assertFalse(any(children.is_loaded(i) for i in range(len(children))))
+        self.assertEqual(block.pack(res), original)
+        self.assertEqual(children[1]['data']['resource_id'], 'SHPI')
+        self.assertEqual([children.is_loaded(i) for i in range(len(children))], [False, True, False, False])
+        self.assertEqual(block.pack(res), original)
+
     def test_cfm_should_reconstruct_offsets(self):
         (name, block, res) = require_file('test/samples/LDIABL.CFM')
         res['items_descr'] = []
@@ -61,6 +107,14 @@ class TestSoundBankBlock(unittest.TestCase):
             for i, x in enumerate(original):
                 self.assertEqual(x, output[i], f"Wrong value at index {i}")
 
+    def test_bnk_from_mmap_should_remain_the_same(self):
+        with open('test/samples/DIABLOSW.BNK', 'rb') as bdata:
+            original = bdata.read()
+        block = SoundBank()
+        with MmapFileReader('test/samples/DIABLOSW.BNK') as reader:
+            res = block.unpack(reader, name='DIABLOSW.BNK', read_bytes_amount=len(original))
+            self.assertEqual(block.pack(res, name='DIABLOSW.BNK'), original)
+
 
 class TestBigfBlock(unittest.TestCase):
 
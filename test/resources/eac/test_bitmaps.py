@@ -0,0 +1,38 @@
+import unittest
+from io import BytesIO
+
+import settings
+from library import require_file
+from resources.eac.bitmaps import Bitmap16Bit0565
+from resources.eac.fields.colors import (Color16Bit0565Block,
+                                         Color16Bit1555Block,
+                                         Color24BitBigEndianField,
+                                         Color24BitLittleEndianField,
+                                         Color32BitBlock)
+
+
+class TestBitmaps(unittest.TestCase):
+
+    def test_numpy_colors_should_match_integer_colors(self):
+        raw = bytes(range(256)) * 3 + bytes([0xC0, 0x07, 0xC0, 0x07])
+        for block in [Color16Bit0565Block(), Color16Bit1555Block(), Color24BitBigEndianField(),
+                      Color24BitLittleEndianField(), Color32BitBlock()]:
+            colors = [block.unpack(BytesIO(raw[i:i + block.length]))
+                      for i in range(0, len(raw) - len(raw) % block.length, block.length)]
+            array = block.unpack_rgba_array(raw[:len(colors) * block.length])
+            self.assertListEqual(array.view('>u4').ravel().tolist(), colors, block.__class__.__name__)
+
+    def test_numpy_bitmap_should_remain_the_same(self):
+        raw = (bytes([0x78, 0x18, 0, 0, 2, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+               + bytes([0xC0, 0x07, 0x1F, 0xF8, 0x12, 0x34, 0xFF, 0xFF]))
+        block = Bitmap16Bit0565()
+        settings.images__unpack_to_numpy_arrays = True
+        try:
+            data = block.unpack(BytesIO(raw))
+        finally:
+            settings.images__unpack_to_numpy_arrays = False
+        self.assertEqual(data['bitmap'].shape, (4, 4))
+        data_list = block.unpack(BytesIO(raw))
+        self.assertListEqual(data['bitmap'].view('>u4').ravel().tolist(), data_list['bitmap'])
+        # transparent color is packed back as 0x07C0, so compare with list data packing
+        self.assertEqual(block.pack(data), block.pack(data_list))
@@ -1,6 +1,7 @@
 import io
 import os
 import unittest
+from random import Random
 
 from resources.eac.compressions.qfs3 import Qfs3Compression
 
@@ -91,4 +92,21 @@ class TestAsmQFS3Algorythm(unittest.TestCase):
                 for i in range(len(fsh)):
                     if i % 10000 == 0:
                         print(f"{i}/{len(fsh)}")
-                    self.assertEqual(fsh[i], uncompressed[i])
\ No newline at end of file
+                    self.assertEqual(fsh[i], uncompressed[i])
+
+    def test_6_al1_compression(self):
+        parser = Qfs3Compression()
+        with open('test/samples/AL1.FSH', 'rb') as fsh_file:
+            fsh = fsh_file.read()
+        compressed = parser.compress(io.BytesIO(fsh), len(fsh))
+        uncompressed = parser.uncompress(io.BytesIO(compressed), len(compressed))
+        self.assertEqual(fsh, bytes(uncompressed))
+
+    def test_7_0xff_first_symbol_compression(self):
+        # 0xFF is the most frequent byte, so it is the first symbol in the character table
+        parser = Qfs3Compression()
+        random = Random(0)
+        data = bytes(x for _ in range(3000) for x in [0xFF, 0xFF, random.randrange(256)])
+        compressed = parser.compress(io.BytesIO(data), len(data))
+        uncompressed = parser.uncompress(io.BytesIO(compressed), len(compressed))
+        self.assertEqual(data, bytes(uncompressed))